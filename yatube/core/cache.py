@@ -0,0 +1,241 @@
+"""Кэш в файле SQLite, общий для всех процессов на одном хосте.
+
+LocMemCache у каждого воркера свой: фрагменты считаются N раз, а сброс
+поколений не доходит до соседних процессов. Здесь все воркеры читают и
+пишут одну таблицу в режиме WAL, так что чтения не ждут записей.
+
+Большие значения сжимаются zlib, целые числа хранятся как INTEGER, и
+incr() выполняется одной транзакцией. При переполнении вытесняются
+давно не читавшиеся ключи (LRU).
+
+Опции (OPTIONS): MAX_ENTRIES, CULL_FREQUENCY — как у встроенных кэшей;
+COMPRESS_MIN_LENGTH — размер, начиная с которого значение сжимается
+(None отключает сжатие); COMPRESS_LEVEL; TOUCH_INTERVAL — как часто,
+в секундах, обновлять время последнего чтения ключа.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+PICKLED, COMPRESSED, INTEGER = 0, 1, 2
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB,'
+    ' kind INTEGER NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+)
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._compress_min_length = options.get('COMPRESS_MIN_LENGTH', 4096)
+        self._compress_level = options.get('COMPRESS_LEVEL', 6)
+        self._touch_interval = options.get('TOUCH_INTERVAL', 1.0)
+        self._local = threading.local()
+
+    def _connection(self):
+        # Соединение своё у каждого потока и каждого процесса: после fork
+        # унаследованным дескриптором SQLite пользоваться нельзя.
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(
+            self._path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            connection.execute(statement)
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _encode(self, value):
+        if type(value) is int:
+            return value, INTEGER
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if (
+            self._compress_min_length is not None
+            and len(data) >= self._compress_min_length
+        ):
+            return zlib.compress(data, self._compress_level), COMPRESSED
+        return data, PICKLED
+
+    @staticmethod
+    def _decode(value, kind):
+        if kind == INTEGER:
+            return value
+        if kind == COMPRESSED:
+            value = zlib.decompress(value)
+        return pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        connection = self._connection()
+        now = time.time()
+        rows = connection.execute(
+            'SELECT key, value, kind, expires, accessed FROM cache '
+            'WHERE key IN ({})'.format(', '.join('?' * len(keys))),
+            list(keys),
+        ).fetchall()
+        found, stale, expired = {}, [], []
+        for cache_key, value, kind, expires, accessed in rows:
+            if expires is not None and expires <= now:
+                expired.append(cache_key)
+                continue
+            found[keys[cache_key]] = self._decode(value, kind)
+            if now - accessed > self._touch_interval:
+                stale.append(cache_key)
+        if stale:
+            connection.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?',
+                [(now, cache_key) for cache_key in stale],
+            )
+        if expired:
+            connection.executemany(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                [(cache_key, now) for cache_key in expired],
+            )
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout=timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = []
+        for key, value in data.items():
+            encoded, kind = self._encode(value)
+            rows.append((self._key(key, version), encoded, kind, expires, now))
+        connection = self._connection()
+        connection.executemany(
+            'INSERT OR REPLACE INTO cache (key, value, kind, expires, '
+            'accessed) VALUES (?, ?, ?, ?, ?)',
+            rows,
+        )
+        self._cull(connection, now)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        encoded, kind = self._encode(value)
+        now = time.time()
+        connection = self._connection()
+        cursor = connection.execute(
+            'INSERT INTO cache (key, value, kind, expires, accessed) '
+            'VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'kind = excluded.kind, expires = excluded.expires, '
+            'accessed = excluded.accessed '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (key, encoded, kind, self.get_backend_timeout(timeout), now, now),
+        )
+        if cursor.rowcount:
+            self._cull(connection, now)
+        return bool(cursor.rowcount)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), now,
+             self._key(key, version), now),
+        )
+        return bool(cursor.rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        connection = self._connection()
+        now = time.time()
+        # BEGIN IMMEDIATE сразу берёт блокировку записи: между чтением
+        # и обновлением никто не успеет изменить счётчик.
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value, kind FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, now),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = self._decode(*row) + delta
+            encoded, kind = self._encode(value)
+            connection.execute(
+                'UPDATE cache SET value = ?, kind = ?, accessed = ? '
+                'WHERE key = ?',
+                (encoded, kind, now, key),
+            )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return value
+
+    def has_key(self, key, version=None):
+        row = self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self._key(key, version), time.time()),
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        self._connection().executemany(
+            'DELETE FROM cache WHERE key = ?',
+            [(self._key(key, version),) for key in keys],
+        )
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединения переиспользуются между запросами, как у LocMemCache.
+        pass
+
+    def _cull(self, connection, now):
+        connection.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            (now,),
+        )
+        total = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if total <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+            (total // self._cull_frequency,),
+        )
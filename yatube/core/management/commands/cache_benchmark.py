@@ -0,0 +1,80 @@
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache import SQLiteCache
+
+SMALL = 'x' * 200
+# Похоже на отрендеренный фрагмент ленты: повторяющаяся разметка.
+LARGE = '<div class="card">Текст поста</div>' * 800
+
+
+def measure(operation, repeat):
+    started = time.perf_counter()
+    for i in range(repeat):
+        operation(i)
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает задержки SQLiteCache и LocMemCache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5000,
+            help='Сколько раз выполнять каждую операцию.',
+        )
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        with tempfile.TemporaryDirectory() as directory:
+            backends = (
+                ('locmem', LocMemCache('benchmark', {})),
+                ('sqlite', SQLiteCache(
+                    os.path.join(directory, 'cache.sqlite3'), {})),
+            )
+            self.stdout.write(
+                f'{"операция":<16}' + ''.join(
+                    f'{name:>12}' for name, _ in backends) + '  мкс/оп')
+            for title, operation in self.operations():
+                timings = [
+                    measure(operation(cache), repeat)
+                    for _, cache in backends
+                ]
+                self.stdout.write(f'{title:<16}' + ''.join(
+                    f'{timing:>12.1f}' for timing in timings))
+
+    def operations(self):
+        def set_small(cache):
+            return lambda i: cache.set(f'small:{i % 100}', SMALL)
+
+        def set_large(cache):
+            return lambda i: cache.set(f'large:{i % 100}', LARGE)
+
+        def get_hit(cache):
+            return lambda i: cache.get(f'large:{i % 100}')
+
+        def get_miss(cache):
+            return lambda i: cache.get(f'missing:{i}')
+
+        def get_many(cache):
+            keys = [f'small:{i}' for i in range(10)]
+            return lambda i: cache.get_many(keys)
+
+        def incr(cache):
+            cache.set('counter', 0)
+            return lambda i: cache.incr('counter')
+
+        return (
+            ('set 200 Б', set_small),
+            ('set 28 КБ', set_large),
+            ('get hit 28 КБ', get_hit),
+            ('get miss', get_miss),
+            ('get_many x10', get_many),
+            ('incr', incr),
+        )
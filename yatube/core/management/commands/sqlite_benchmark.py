@@ -0,0 +1,92 @@
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import got_request_exception
+from django.db import OperationalError, connections
+from django.test.utils import override_settings
+
+from core.sqlite import backup
+
+# Умолчания SQLite: журнал отката и fsync на каждой транзакции.
+# busy timeout в 5 секунд задаёт сам модуль sqlite3 Python.
+PROFILES = (
+    ('default', {
+        'SQLITE_PRAGMAS': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+        'SQLITE_TRANSACTION_MODE': '',
+    }),
+    ('tuned', {}),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет loadtest на копиях базы с журналом по умолчанию и с '
+        'профилем SQLITE_PRAGMAS и сравнивает пропускную способность и '
+        'число ошибок «database is locked».'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        database = connections.databases['default']
+        if database['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Замер имеет смысл только для SQLite.')
+        source = database['NAME']
+        self.locked = 0
+        self.lock = threading.Lock()
+        got_request_exception.connect(self.count_locked)
+        logger = logging.getLogger('django.request')
+        disabled, logger.disabled = logger.disabled, True
+        report = {}
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                for name, overrides in PROFILES:
+                    path = os.path.join(directory, f'{name}.sqlite3')
+                    backup(source, path)
+                    database['NAME'] = path
+                    try:
+                        report[name] = self.run(overrides, options)
+                    finally:
+                        connections['default'].close()
+                        database['NAME'] = source
+        finally:
+            logger.disabled = disabled
+            got_request_exception.disconnect(self.count_locked)
+        default, tuned = report['default'], report['tuned']
+        if default['throughput_rps']:
+            report['speedup'] = round(
+                tuned['throughput_rps'] / default['throughput_rps'], 2)
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+
+    def count_locked(self, sender, request=None, **kwargs):
+        # Сигнал отправляется из блока except, исключение ещё доступно.
+        error = sys.exc_info()[1]
+        if isinstance(error, OperationalError) and 'locked' in str(error):
+            with self.lock:
+                self.locked += 1
+
+    def run(self, overrides, options):
+        self.locked = 0
+        output = StringIO()
+        with override_settings(**overrides):
+            call_command(
+                'loadtest', threads=options['threads'],
+                requests=options['requests'], seed=options['seed'],
+                stdout=output)
+        result = json.loads(output.getvalue())
+        return {
+            'throughput_rps': result['throughput_rps'],
+            'p95_ms': result['overall'].get('p95_ms'),
+            'errors': result['errors'],
+            'locked_errors': self.locked,
+        }
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.replicas import synced
+from core.sqlite import backup
+
+SQLITE = 'django.db.backends.sqlite3'
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в файлы реплик. Между запусками '
+        'реплика отстаёт, как при асинхронной репликации.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'aliases', nargs='*',
+            help='Какие базы обновить; по умолчанию REPLICA_DATABASES '
+                 'или, если он пуст, все, кроме default.')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or settings.REPLICA_DATABASES or [
+            alias for alias in connections.databases
+            if alias != DEFAULT_DB_ALIAS
+        ]
+        primary = connections.databases[DEFAULT_DB_ALIAS]
+        for alias in aliases:
+            if alias not in connections.databases:
+                raise CommandError(f'Нет базы {alias}.')
+            replica = connections.databases[alias]
+            if SQLITE != primary['ENGINE'] or SQLITE != replica['ENGINE']:
+                raise CommandError(
+                    f'{alias}: копировать умеем только SQLite в SQLite.')
+            connections[alias].close()
+            backup(primary['NAME'], replica['NAME'])
+            synced(alias)
+            self.stdout.write(f'{alias}: {replica["NAME"]}')
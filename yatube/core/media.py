@@ -0,0 +1,151 @@
+"""Отдача файлов из MEDIA_ROOT.
+
+Django отвечает на условные запросы (ETag, If-None-Match → 304) и
+Range, а сами байты передаёт одним из способов:
+
+* FileResponse: WSGI-сервер с wsgi.file_wrapper (gunicorn) шлёт файл
+  через os.sendfile без копирования в Python; диапазоны Range читаются
+  ограниченным итератором (PartialFileResponse);
+* MEDIA_SENDFILE = 'x-accel-redirect' или 'x-sendfile': ответ без тела
+  с заголовком для nginx или Apache/lighttpd, файл и Range отдаёт уже
+  фронтовый сервер.
+
+Имена по содержимому (MEDIA_IMMUTABLE_PATTERNS) никогда не меняют
+байты, поэтому кэшируются браузером на год с immutable.
+"""
+import mimetypes
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.http import http_date
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+SENDFILE_HEADERS = {
+    'x-accel-redirect': 'X-Accel-Redirect',
+    'x-sendfile': 'X-Sendfile',
+}
+
+
+def etag(name, stat_result):
+    """Сильный ETag: по хэшу в имени для неизменных файлов, иначе по
+    времени изменения и размеру, как у nginx."""
+    if is_immutable(name):
+        return '"%s"' % name.rsplit('/', 1)[-1].split('.', 1)[0]
+    return '"%x-%x"' % (stat_result.st_mtime_ns, stat_result.st_size)
+
+
+def is_immutable(name):
+    return any(
+        re.search(pattern, name)
+        for pattern in settings.MEDIA_IMMUTABLE_PATTERNS
+    )
+
+
+def is_file(stat_result):
+    return stat.S_ISREG(stat_result.st_mode)
+
+
+def parse_range(header, size):
+    """(начало, длина) для Range: bytes=a-b, a- или -n.
+
+    None — заголовка нет или он не поддерживается (несколько
+    диапазонов): отдаётся весь файл. ValueError — диапазон за концом
+    файла, ответ 416.
+    """
+    match = RANGE.match(header or '')
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        length = min(int(last), size)
+        if not length:
+            raise ValueError(header)
+        return size - length, length
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size or last < first:
+        raise ValueError(header)
+    return first, last - first + 1
+
+
+def set_cache_headers(response, name, tag, stat_result):
+    response['ETag'] = tag
+    response['Last-Modified'] = http_date(stat_result.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    if is_immutable(name):
+        response['Cache-Control'] = (
+            f'public, max-age={settings.MEDIA_IMMUTABLE_MAX_AGE}, immutable')
+    else:
+        response['Cache-Control'] = (
+            f'public, max-age={settings.MEDIA_MAX_AGE}')
+    return response
+
+
+def respond(request, name, path, stat_result, tag):
+    """Ответ на GET файла name, лежащего по пути path."""
+    size = stat_result.st_size
+    header = request.META.get('HTTP_RANGE')
+    # Диапазон от другой версии файла склеился бы с чужими байтами.
+    if request.META.get('HTTP_IF_RANGE', tag) != tag:
+        header = None
+    try:
+        byte_range = parse_range(header, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if settings.MEDIA_SENDFILE:
+        response = HttpResponse(
+            content_type=mimetypes.guess_type(path)[0]
+            or 'application/octet-stream')
+        response[SENDFILE_HEADERS[settings.MEDIA_SENDFILE]] = (
+            settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(name)
+            if settings.MEDIA_SENDFILE == 'x-accel-redirect' else path)
+    elif byte_range is None:
+        response = FileResponse(open(path, 'rb'))
+    else:
+        start, length = byte_range
+        file = open(path, 'rb')
+        file.seek(start)
+        response = PartialFileResponse(file, length)
+        response['Content-Range'] = (
+            f'bytes {start}-{start + length - 1}/{size}')
+    return set_cache_headers(response, name, tag, stat_result)
+
+
+class PartialFileResponse(FileResponse):
+    """FileResponse с length байтами файла, перемотанного на начало
+    диапазона.
+
+    wsgi.file_wrapper получает файл целиком и не обязан смотреть на
+    Content-Length (wsgiref, runserver отправили бы его до конца),
+    поэтому диапазон всегда отдаётся ограниченным итератором; sendfile
+    остаётся для полных файлов и X-Accel-Redirect/X-Sendfile.
+    """
+    status_code = 206
+
+    def __init__(self, file, length, **kwargs):
+        self.length = length
+        super().__init__(file, **kwargs)
+
+    def _set_streaming_content(self, value):
+        super()._set_streaming_content(value)
+        if self.file_to_stream is None:
+            return
+        self.file_to_stream = None
+        self['Content-Length'] = self.length
+        super(FileResponse, self)._set_streaming_content(
+            self._read(value, self.length))
+
+    def _read(self, file, length):
+        while length > 0:
+            chunk = file.read(min(self.block_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
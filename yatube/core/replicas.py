@@ -0,0 +1,104 @@
+"""Чтение с реплик и запись в основную базу.
+
+ReplicaRouter отправляет чтения на одну из REPLICA_DATABASES, но только
+внутри GET/HEAD-запросов, отмеченных ReplicaMiddleware: команды, сигналы
+и фоновые потоки читают основную базу. Внутри transaction.atomic() и
+после первой записи в запросе чтения тоже идут в основную базу, иначе
+представление не увидит того, что само записало.
+
+Реплика отстаёт, поэтому после записи пользователь ещё
+REPLICA_STICKY_SECONDS читает основную базу: срок хранится в сессии, и
+свой новый пост или комментарий он видит сразу.
+
+Остальные читатели видят реплику такой, какой её оставил последний
+sync_replica, а запись увеличивает поколения кэша сразу. Чтобы
+отрисованное с отстающей реплики не легло на часы под новое поколение,
+ключи кэша включают отметку синхронизации реплики (sync_point).
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SESSION_KEY = '_primary_until'
+SAFE_METHODS = ('GET', 'HEAD')
+
+_state = threading.local()
+
+
+def _sync_key(alias):
+    return f'replica-sync:{alias}'
+
+
+def read_alias():
+    """База, из которой сейчас читает текущий поток."""
+    replica = getattr(_state, 'replica', None)
+    if (
+        not settings.REPLICA_DATABASES
+        or replica is None
+        or _state.wrote
+        or connections[DEFAULT_DB_ALIAS].in_atomic_block
+    ):
+        return DEFAULT_DB_ALIAS
+    return replica
+
+
+def synced(alias):
+    """Реплика alias только что скопирована с основной базы."""
+    cache.set(_sync_key(alias), time.time_ns(), None)
+
+
+def sync_point():
+    """Добавка к ключам кэша по поколениям: пусто при чтении основной
+    базы, иначе отметка последней синхронизации реплики."""
+    alias = read_alias()
+    if alias == DEFAULT_DB_ALIAS:
+        return ''
+    return f'@{alias}.{cache.get(_sync_key(alias), 0)}'
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        # Сессия пишется на каждый вход и не меняет контент.
+        if model._meta.app_label != 'sessions':
+            _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Во всех базах одни и те же данные.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REPLICA_DATABASES:
+            # Без реплик незачем читать сессию на каждом запросе.
+            return self.get_response(request)
+        sticky = request.session.get(SESSION_KEY, 0) > time.time()
+        # Одна реплика на весь запрос: её отметка синхронизации входит
+        # в ключи кэша, которые он заполняет.
+        _state.replica = (
+            random.choice(settings.REPLICA_DATABASES)
+            if request.method in SAFE_METHODS and not sticky else None)
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = _state.wrote
+            _state.replica, _state.wrote = None, False
+        if wrote:
+            request.session[SESSION_KEY] = (
+                time.time() + settings.REPLICA_STICKY_SECONDS)
+        return response
@@ -0,0 +1,48 @@
+"""Настройки SQLite для каждого нового соединения с базой.
+
+По умолчанию SQLite пишет журнал отката: читатели ждут писателя, а
+писатель, не дождавшись блокировки, сразу получает «database is locked».
+Профиль из SQLITE_PRAGMAS включает WAL, в котором чтения идут параллельно
+с записью, даёт писателям подождать друг друга (busy_timeout), ослабляет
+fsync до границы контрольной точки (synchronous=NORMAL) и увеличивает
+кэш страниц и отображение файла в память.
+
+busy_timeout не спасает транзакцию, которая сначала читала, а потом
+начала писать: если базу успел изменить другой писатель, SQLite сразу
+отвечает «locked». Поэтому transaction.atomic() открывает транзакцию
+с режимом SQLITE_TRANSACTION_MODE (IMMEDIATE): блокировка на запись
+берётся в начале и ждёт в очереди вместе с остальными.
+"""
+import sqlite3
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def begin_in_mode(execute, sql, params, many, context):
+    if sql == 'BEGIN' and settings.SQLITE_TRANSACTION_MODE:
+        sql = f'BEGIN {settings.SQLITE_TRANSACTION_MODE}'
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    # Обёртка живёт столько же, сколько соединение.
+    if begin_in_mode not in connection.execute_wrappers:
+        connection.execute_wrappers.append(begin_in_mode)
+
+
+def backup(source, target):
+    """Согласованная копия файла базы через backup API SQLite."""
+    origin, replica = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        origin.backup(replica)
+    finally:
+        replica.close()
+        origin.close()
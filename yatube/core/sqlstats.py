@@ -0,0 +1,187 @@
+"""Замер SQL по запросам: число запросов, время, медленные и повторы.
+
+Middleware оборачивает выполнение запросов к базе только в выбранных
+сэмплированием HTTP-запросах (SQL_STATS_SAMPLE_RATE), поэтому остальные
+запросы не платят ничего, кроме одного вызова random().
+
+Итоги отдаются клиенту заголовком Server-Timing и копятся в памяти
+процесса по имени URL (posts:index, posts:profile, ...). Раз в
+SQL_STATS_FLUSH_INTERVAL секунд процесс кладёт свой снимок в общий кэш,
+откуда страница статистики собирает данные всех воркеров.
+"""
+import os
+import random
+import re
+import socket
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+SLOWEST = 5
+DUPLICATE_THRESHOLD = 3
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+PROCESSES_KEY = 'sql-stats:processes'
+IN_LIST = re.compile(r'IN \((?:%s|\?)(?:, (?:%s|\?))*\)')
+NOT_TOKEN = re.compile(r'[^\x20-\x7e]|"')
+
+
+def fingerprint(sql):
+    """SQL без различий в длине списков IN: одинаков у запросов N+1."""
+    return IN_LIST.sub('IN (...)', sql)
+
+
+class RequestQueries:
+    """Запросы к базе одного HTTP-запроса; подключается execute_wrapper."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            self.fingerprints[fingerprint(sql)] += 1
+            self.slowest.append((duration, sql))
+            if len(self.slowest) > SLOWEST:
+                self.slowest.remove(min(self.slowest))
+
+    def duplicates(self):
+        return {
+            sql: count for sql, count in self.fingerprints.items()
+            if count >= DUPLICATE_THRESHOLD
+        }
+
+
+def _empty():
+    return {
+        'requests': 0,
+        'queries': 0,
+        'sql_seconds': 0.0,
+        'total_seconds': 0.0,
+        'max_queries': 0,
+        'duplicates': {},
+        'slowest': [],
+    }
+
+
+def merge(target, source):
+    """Складывает статистику одного URL из source в target."""
+    for field in ('requests', 'queries', 'sql_seconds', 'total_seconds'):
+        target[field] += source[field]
+    target['max_queries'] = max(target['max_queries'], source['max_queries'])
+    for sql, count in source['duplicates'].items():
+        target['duplicates'][sql] = target['duplicates'].get(sql, 0) + count
+    target['slowest'] = sorted(
+        target['slowest'] + source['slowest'], reverse=True)[:SLOWEST]
+
+
+class Aggregate:
+    """Накопленная статистика процесса по именам URL."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.flushed = time.monotonic()
+        self.key = f'sql-stats:{socket.gethostname()}:{os.getpid()}'
+
+    def add(self, name, queries, total):
+        sample = {
+            'requests': 1,
+            'queries': queries.count,
+            'sql_seconds': queries.duration,
+            'total_seconds': total,
+            'max_queries': queries.count,
+            'duplicates': queries.duplicates(),
+            'slowest': [list(item) for item in queries.slowest],
+        }
+        with self.lock:
+            merge(self.views.setdefault(name, _empty()), sample)
+            due = (
+                time.monotonic() - self.flushed
+                >= settings.SQL_STATS_FLUSH_INTERVAL
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            snapshot = {
+                name: dict(stats, duplicates=dict(stats['duplicates']))
+                for name, stats in self.views.items()
+            }
+            self.flushed = time.monotonic()
+        cache.set(self.key, snapshot, SNAPSHOT_TIMEOUT)
+        processes = cache.get(PROCESSES_KEY) or []
+        if self.key not in processes:
+            # Гонка с соседним процессом может потерять ключ, но он
+            # вернётся в список при следующем сбросе.
+            cache.set(PROCESSES_KEY, processes + [self.key], SNAPSHOT_TIMEOUT)
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+
+aggregate = Aggregate()
+
+
+def collected():
+    """Статистика всех процессов, сведённая по именам URL."""
+    aggregate.flush()
+    processes = cache.get(PROCESSES_KEY) or []
+    views = {}
+    for snapshot in cache.get_many(processes).values():
+        for name, stats in snapshot.items():
+            merge(views.setdefault(name, _empty()), stats)
+    return views
+
+
+def _quote(text):
+    return NOT_TOKEN.sub('', text)[:80]
+
+
+def server_timing(queries, total):
+    metrics = [
+        f'sql;dur={queries.duration * 1000:.1f};'
+        f'desc="{queries.count} queries"',
+        f'app;dur={(total - queries.duration) * 1000:.1f}',
+    ]
+    for sql, count in sorted(
+        queries.duplicates().items(), key=lambda item: -item[1]
+    )[:3]:
+        metrics.append(f'dup;desc="{count}x {_quote(sql)}"')
+    return ', '.join(metrics)
+
+
+class SQLStatsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SQL_STATS_SAMPLE_RATE:
+            return self.get_response(request)
+        queries = RequestQueries()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(queries))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+        response['Server-Timing'] = server_timing(queries, total)
+        match = getattr(request, 'resolver_match', None)
+        aggregate.add(
+            match.view_name if match else '<unresolved>', queries, total)
+        return response
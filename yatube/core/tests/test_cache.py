@@ -0,0 +1,81 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+from django.test import SimpleTestCase
+
+from ..cache import COMPRESSED, INTEGER, SQLiteCache
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def stored_kind(self, key):
+        with sqlite3.connect(self.location) as connection:
+            return connection.execute(
+                'SELECT kind FROM cache WHERE key = ?',
+                (self.cache.make_key(key),),
+            ).fetchone()[0]
+
+    def test_values_are_shared_between_instances(self):
+        self.cache.set('key', {'a': 1})
+        self.assertEqual(self.make_cache().get('key'), {'a': 1})
+
+    def test_large_values_are_compressed(self):
+        value = 'фрагмент ' * 1000
+        self.cache.set('large', value)
+        self.assertEqual(self.cache.get('large'), value)
+        self.assertEqual(self.stored_kind('large'), COMPRESSED)
+
+    def test_add_and_expiry(self):
+        self.assertTrue(self.cache.add('key', 1))
+        self.assertFalse(self.cache.add('key', 2))
+        self.cache.set('expired', 1, timeout=-1)
+        self.assertIsNone(self.cache.get('expired'))
+        self.assertTrue(self.cache.add('expired', 2))
+        self.assertEqual(self.cache.get('expired'), 2)
+
+    def test_incr_is_atomic(self):
+        self.cache.set('counter', 0)
+        caches = [self.make_cache() for _ in range(4)]
+
+        def worker(cache):
+            for _ in range(50):
+                cache.incr('counter')
+
+        threads = [
+            threading.Thread(target=worker, args=(cache,))
+            for cache in caches
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        self.assertEqual(self.stored_kind('counter'), INTEGER)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_cull_evicts_least_recently_used(self):
+        cache = self.make_cache(
+            MAX_ENTRIES=4, CULL_FREQUENCY=2, TOUCH_INTERVAL=0)
+        for i in range(4):
+            cache.set(f'key{i}', i)
+        cache.get('key0')
+        cache.get('key1')
+        cache.set('key4', 4)
+        self.assertEqual(
+            set(cache.get_many([f'key{i}' for i in range(5)])),
+            {'key0', 'key1', 'key4'},
+        )
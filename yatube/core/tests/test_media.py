@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+from wsgiref.util import FileWrapper
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import RequestFactory, TestCase, override_settings
+
+from core.media import parse_range
+
+HASHED = 'posts/ab/cd/' + 'abcd' * 16 + '.jpg'
+CONTENT = bytes(range(256)) * 4
+
+
+class MediaViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = tempfile.mkdtemp()
+        cls.settings = override_settings(MEDIA_ROOT=cls.media)
+        cls.settings.enable()
+        for name in (HASHED, 'legacy.txt'):
+            path = os.path.join(cls.media, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        shutil.rmtree(cls.media, ignore_errors=True)
+        super().tearDownClass()
+
+    def get(self, name, **headers):
+        response = self.client.get(f'/media/{name}', **headers)
+        self.addCleanup(response.close)
+        return response
+
+    def test_content_named_file_is_immutable(self):
+        response = self.get(HASHED)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['ETag'], '"' + 'abcd' * 16 + '"')
+        self.assertIn('immutable', response['Cache-Control'])
+        legacy = self.get('legacy.txt')
+        self.assertNotIn('immutable', legacy['Cache-Control'])
+        self.assertRegex(legacy['ETag'], r'^"[0-9a-f]+-400"$')
+
+    def test_matching_etag_gets_not_modified(self):
+        tag = self.get('legacy.txt')['ETag']
+        response = self.get('legacy.txt', HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], tag)
+
+    def test_range_returns_only_requested_bytes(self):
+        response = self.get(HASHED, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(
+            b''.join(response.streaming_content), CONTENT[10:20])
+        stale = self.get(
+            HASHED, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"old"')
+        self.assertEqual(stale.status_code, 200)
+        outside = self.get(HASHED, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(outside.status_code, 416)
+        self.assertEqual(outside['Content-Range'], 'bytes */1024')
+
+    def test_range_through_file_wrapper(self):
+        # Так ответ отдают wsgiref и runserver: file_wrapper не знает о
+        # Content-Length и читает файл до конца.
+        environ = RequestFactory().get(
+            f'/media/{HASHED}', HTTP_RANGE='bytes=0-9').environ
+        environ['wsgi.file_wrapper'] = FileWrapper
+        started = []
+        body = WSGIHandler()(
+            environ, lambda status, headers: started.append(status))
+        try:
+            self.assertEqual(b''.join(body), CONTENT[:10])
+        finally:
+            body.close()
+        self.assertEqual(started, ['206 Partial Content'])
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-', 100), (0, 100))
+        self.assertEqual(parse_range('bytes=-30', 100), (70, 30))
+        self.assertEqual(parse_range('bytes=90-200', 100), (90, 10))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_range(None, 100))
+        with self.assertRaises(ValueError):
+            parse_range('bytes=5-1', 100)
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect')
+    def test_accel_redirect_hands_file_to_nginx(self):
+        response = self.get(HASHED, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(
+            response['X-Accel-Redirect'], f'/protected-media/{HASHED}')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_missing_and_outside_files_are_not_found(self):
+        self.assertEqual(self.get('nope.jpg').status_code, 404)
+        self.assertEqual(self.get('posts/ab').status_code, 404)
+        self.assertEqual(self.get('../etc/passwd').status_code, 404)
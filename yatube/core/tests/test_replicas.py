@@ -0,0 +1,108 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.test import (
+    SimpleTestCase, TestCase, TransactionTestCase, override_settings)
+from django.urls import reverse
+
+from posts import generations
+from posts.models import Post
+
+from .. import replicas
+
+User = get_user_model()
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = replicas.ReplicaRouter()
+        replicas._state.replica = 'replica'
+        replicas._state.wrote = False
+        self.addCleanup(vars(replicas._state).clear)
+
+    def test_reads_go_to_replica_until_first_write(self):
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+        self.router.db_for_write(Session)
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_reads_outside_requests_go_to_primary(self):
+        replicas._state.replica = None
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_replicas_are_not_migrated(self):
+        self.assertTrue(self.router.allow_migrate('default', 'posts'))
+        self.assertFalse(self.router.allow_migrate('replica', 'posts'))
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReadYourWritesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='writer')
+        cls.post = Post.objects.create(author=cls.user, text='Текст')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_reads_do_not_pin_session_to_primary(self):
+        self.client.get(reverse('posts:index'))
+        self.assertNotIn(replicas.SESSION_KEY, self.client.session)
+
+    def test_write_pins_session_to_primary(self):
+        self.client.post(
+            reverse('posts:add_comment', args=(self.post.pk,)),
+            {'text': 'Комментарий'})
+        self.assertGreater(
+            self.client.session[replicas.SESSION_KEY], time.time())
+
+    def test_pinned_session_reads_primary(self):
+        session = self.client.session
+        session[replicas.SESSION_KEY] = time.time() + 10
+        session.save()
+        seen = []
+        middleware = replicas.ReplicaMiddleware(
+            lambda request: seen.append(replicas._state.replica))
+        request = self.client.get(reverse('posts:index')).wsgi_request
+        middleware(request)
+        session[replicas.SESSION_KEY] = time.time() - 1
+        session.save()
+        request = self.client.get(reverse('posts:index')).wsgi_request
+        middleware(request)
+        self.assertEqual(seen, [None, 'replica'])
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaLagTest(TransactionTestCase):
+    # Внутри TestCase всё идёт в atomic(), а там чтения не уходят на
+    # реплику.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='author')
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_stale_replica_page_expires_with_next_sync(self):
+        replicas.synced('replica')
+        # Запись уже увеличила поколение, а реплика поста ещё не видела:
+        # страница с неё попадает в кэш без нового поста.
+        generations.bump(generations.INDEX)
+        stale = self.client.get('/')
+        Post.objects.bulk_create([Post(author=self.user, text='Новый пост')])
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=stale['ETag'])
+        self.assertEqual(response.status_code, 304)
+        replicas.synced('replica')
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=stale['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новый пост')
+
+    def test_primary_reads_do_not_depend_on_sync(self):
+        replicas._state.replica = None
+        self.addCleanup(vars(replicas._state).clear)
+        self.assertEqual(replicas.sync_point(), '')
@@ -0,0 +1,43 @@
+import os
+import sqlite3
+import tempfile
+
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import SimpleTestCase
+
+
+class SQLitePragmasTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'db.sqlite3')
+        self.database = DatabaseWrapper(
+            dict(connection.settings_dict, NAME=self.path), 'pragmas')
+        self.addCleanup(self.database.close)
+
+    def pragma(self, name):
+        with self.database.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_profile_is_applied_to_new_connections(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('cache_size'), -64 * 1024)
+
+    def test_transaction_takes_write_lock_upfront(self):
+        with self.database.cursor() as cursor:
+            cursor.execute('CREATE TABLE note (text TEXT)')
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        # Так транзакцию начинает transaction.atomic().
+        self.database._start_transaction_under_autocommit()
+        try:
+            with self.assertRaisesMessage(
+                sqlite3.OperationalError, 'locked'
+            ):
+                other.execute("INSERT INTO note VALUES ('x')")
+        finally:
+            self.database.cursor().execute('ROLLBACK')
@@ -0,0 +1,65 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Comment, Post
+
+from .. import sqlstats
+
+User = get_user_model()
+
+
+@override_settings(SQL_STATS_SAMPLE_RATE=1.0)
+class SQLStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        post = Post.objects.create(author=cls.staff, text='Текст')
+        Comment.objects.create(post=post, author=cls.staff, text='Ответ')
+        cls.post = post
+
+    def setUp(self):
+        cache.clear()
+        sqlstats.aggregate.reset()
+
+    def test_fingerprint_ignores_in_list_length(self):
+        self.assertEqual(
+            sqlstats.fingerprint('SELECT 1 WHERE id IN (%s, %s, %s)'),
+            sqlstats.fingerprint('SELECT 1 WHERE id IN (%s)'),
+        )
+
+    def test_response_has_server_timing(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^sql;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+')
+
+    @override_settings(SQL_STATS_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_not_measured(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(sqlstats.collected(), {})
+
+    def test_duplicate_queries_are_reported(self):
+        queries = sqlstats.RequestQueries()
+        for pk in range(4):
+            queries(lambda *args: None, 'SELECT %s', (pk,), False, {})
+        self.assertEqual(queries.duplicates(), {'SELECT %s': 4})
+        self.assertIn('dup;desc="4x SELECT %s"',
+                      sqlstats.server_timing(queries, 0.01))
+
+    def test_stats_page_aggregates_by_url_name(self):
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('core:sql_stats'))
+        views = {view['name']: view for view in response.context['views']}
+        self.assertEqual(views['posts:index']['requests'], 2)
+        self.assertEqual(views['posts:post_detail']['requests'], 1)
+        self.client.logout()
+        self.assertEqual(
+            self.client.get(reverse('core:sql_stats')).status_code, 302)
@@ -1,4 +1,15 @@
+import os
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
+
+from core import media, sqlstats
 
 
 def page_not_found(request, exception):
@@ -15,3 +26,48 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=403)
+
+
+@staff_member_required
+def sql_stats(request):
+    views = []
+    for name, stats in sqlstats.collected().items():
+        requests = stats['requests']
+        views.append({
+            'name': name,
+            'requests': requests,
+            'queries': stats['queries'] / requests,
+            'max_queries': stats['max_queries'],
+            'sql_ms': stats['sql_seconds'] / requests * 1000,
+            'total_ms': stats['total_seconds'] / requests * 1000,
+            'duplicates': sorted(
+                stats['duplicates'].items(), key=lambda item: -item[1]),
+            'slowest': [
+                (duration * 1000, sql) for duration, sql in stats['slowest']
+            ],
+        })
+    views.sort(key=lambda view: -view['sql_ms'] * view['requests'])
+    context = {
+        'views': views,
+        'sample_rate': settings.SQL_STATS_SAMPLE_RATE,
+    }
+    return render(request, 'core/sql_stats.html', context)
+
+
+@require_safe
+def serve_media(request, path):
+    """Файл из MEDIA_ROOT с ETag, Range и кэшем браузера (core.media)."""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat_result = os.stat(full_path)
+    except (OSError, SuspiciousFileOperation):
+        raise Http404
+    if not media.is_file(stat_result):
+        raise Http404
+    tag = media.etag(path, stat_result)
+    not_modified = get_conditional_response(
+        request, etag=tag, last_modified=int(stat_result.st_mtime))
+    if not_modified is not None:
+        return media.set_cache_headers(
+            not_modified, path, tag, stat_result)
+    return media.respond(request, path, full_path, stat_result, tag)
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from posts import search
 from posts.models import Post, Group, Comment, Follow
 
 
@@ -8,13 +9,20 @@ class PostAdmin(admin.ModelAdmin):
         'text',
         'pub_date',
         'author',
-        'group'
+        'group',
+        'comment_count',
     )
     list_editable = ('group',)
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Вместо LIKE '%term%' по всей таблице — полнотекстовый индекс.
+        if not search.match_expression(search_term):
+            return queryset, False
+        return queryset.filter(pk__in=search.post_ids(search_term)), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = (
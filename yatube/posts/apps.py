@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PostsConfig(AppConfig):
     name = 'posts'
     verbose_name = 'приложение для опубликования записей'
+
+    def ready(self):
+        from posts import signals  # noqa: F401
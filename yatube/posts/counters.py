@@ -0,0 +1,63 @@
+from collections import defaultdict
+
+from django.db.models import F
+
+from posts.models import Follow, Post, Profile
+
+
+def bump(queryset, field, delta):
+    """Сдвигает счётчик одним UPDATE ... SET field = field + delta;
+    возвращает число изменённых строк."""
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gt': 0})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def profile(user_id):
+    """Профиль пользователя; если его нет (пользователь загружен
+    фикстурой или bulk_create), он создаётся с посчитанными счётчиками."""
+    found, _ = Profile.objects.get_or_create(user_id=user_id, defaults={
+        'posts_count': Post.objects.filter(author_id=user_id).count(),
+        'followers_count': Follow.objects.filter(author_id=user_id).count(),
+        'following_count': Follow.objects.filter(user_id=user_id).count(),
+    })
+    return found
+
+
+def bump_profile(user_id, field, delta):
+    updated = bump(Profile.objects.filter(user_id=user_id), field, delta)
+    # Новый профиль считается заново, и изменение в нём уже учтено.
+    # При уменьшении профиля может не быть, потому что удаляется сам
+    # пользователь: его не создаём.
+    if not updated and delta > 0:
+        profile(user_id)
+
+
+def bump_each(queryset, key, field, deltas):
+    """Сдвигает счётчики многих строк: deltas — {значение key: сдвиг}.
+
+    Строки с одинаковым сдвигом обновляются одним UPDATE.
+    """
+    keys_by_delta = defaultdict(list)
+    for value, delta in deltas.items():
+        if value is not None and delta:
+            keys_by_delta[delta].append(value)
+    for delta, keys in keys_by_delta.items():
+        bump(queryset.filter(**{f'{key}__in': keys}), field, delta)
+
+
+def post_added(post, delta=1):
+    if post.author_id:
+        bump_profile(post.author_id, 'posts_count', delta)
+
+
+def comment_added(comment, delta=1):
+    if comment.post_id:
+        bump(Post.objects.filter(pk=comment.post_id), 'comment_count', delta)
+
+
+def follow_added(follow, delta=1):
+    if follow.author_id:
+        bump_profile(follow.author_id, 'followers_count', delta)
+    if follow.user_id:
+        bump_profile(follow.user_id, 'following_count', delta)
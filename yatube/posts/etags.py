@@ -0,0 +1,62 @@
+"""ETag для страниц лент и поста.
+
+Валидатор собирается из поколений кэша (posts.generations) и не требует
+загрузки постов: на совпавший If-None-Match отвечаем 304 до запуска
+представления и шаблонизатора.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY, get_user_model
+
+from posts import generations
+from posts.models import Group, Post
+
+User = get_user_model()
+
+
+def _etag(request, *scopes):
+    # Страница зависит от пользователя (шапка, кнопки, csrf-токен формы),
+    # поэтому в валидатор входят ключ сессии и csrf-cookie.
+    state = '|'.join((
+        generations.get(*scopes),
+        request.get_full_path(),
+        request.session.session_key or '',
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ))
+    return hashlib.md5(state.encode()).hexdigest()
+
+
+def _reader_scopes(request):
+    user_id = request.session.get(SESSION_KEY)
+    return (generations.reader(user_id),) if user_id else ()
+
+
+def index(request):
+    return _etag(request, generations.INDEX)
+
+
+def group_posts(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    if group_id is None:
+        return None
+    return _etag(request, generations.group(group_id))
+
+
+def profile(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    if author_id is None:
+        return None
+    return _etag(
+        request, generations.author(author_id), *_reader_scopes(request))
+
+
+def post_detail(request, post_id):
+    author_id = Post.objects.filter(pk=post_id).values_list(
+        'author_id', flat=True).first()
+    if author_id is None:
+        return None
+    return _etag(
+        request, generations.post(post_id), generations.author(author_id))
@@ -0,0 +1,101 @@
+"""Потоковая выгрузка постов в NDJSON: один JSON-объект на строку.
+
+Посты читаются итератором по возрастанию (pub_date, id) и без создания
+моделей, а авторы и группы подтягиваются одним запросом на пачку строк,
+так что память не растёт с размером выгрузки. В каждой строке есть
+курсор: передав его в after, выгрузку можно продолжить с места обрыва.
+"""
+import json
+from datetime import datetime, time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from posts.models import Group, Post
+from posts.paginators import decode_cursor, encode_position
+
+User = get_user_model()
+
+CHUNK_SIZE = 2000
+FIELDS = (
+    'pk', 'text', 'pub_date', 'author_id', 'group_id', 'image',
+    'comment_count',
+)
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_moment(value):
+    """Дата или дата со временем из параметра since/until."""
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = day and datetime.combine(day, time.min)
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ExportError(f'Не удалось разобрать дату: {value}')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def select(author=None, group=None, since=None, until=None, after=None):
+    """Посты для выгрузки в порядке (pub_date, id), начиная после after."""
+    posts = Post.objects.all()
+    if author:
+        posts = posts.filter(author__username=author)
+    if group:
+        posts = posts.filter(group__slug=group)
+    if since:
+        posts = posts.filter(pub_date__gte=parse_moment(since))
+    if until:
+        posts = posts.filter(pub_date__lt=parse_moment(until))
+    position = None
+    if after:
+        decoded = decode_cursor(after)
+        if (
+            decoded is None
+            or decoded[1]
+            or not isinstance(decoded[0][0], datetime)
+        ):
+            raise ExportError('Неверный курсор.')
+        position = decoded[0]
+    # backwards=True в seek — это движение от старых постов к новым.
+    return posts.seek(position, backwards=True)
+
+
+def rows(posts, chunk_size=CHUNK_SIZE):
+    """Словари постов с именами авторов и слагами групп."""
+    values = posts.values(*FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(values, chunk_size))
+        if not chunk:
+            return
+        authors = dict(User.objects.filter(
+            pk__in={row['author_id'] for row in chunk}
+        ).values_list('pk', 'username'))
+        groups = dict(Group.objects.filter(
+            pk__in={row['group_id'] for row in chunk}
+        ).values_list('pk', 'slug'))
+        for row in chunk:
+            yield {
+                'id': row['pk'],
+                'pub_date': row['pub_date'].isoformat(),
+                'author': authors.get(row['author_id']),
+                'group': groups.get(row['group_id']),
+                'text': row['text'],
+                'image': row['image'] or None,
+                'comment_count': row['comment_count'],
+                'cursor': encode_position((row['pub_date'], row['pk'])),
+            }
+
+
+def ndjson(posts, chunk_size=CHUNK_SIZE):
+    for row in rows(posts, chunk_size):
+        yield json.dumps(row, ensure_ascii=False) + '\n'
@@ -0,0 +1,53 @@
+"""Число постов в лентах для номеров страниц без COUNT(*) на запрос.
+
+Счёт хранится в кэше вместе с поколением ленты, для которого он
+посчитан. Пока поколение то же, число точное. После изменения ленты
+отдаётся прежнее значение, а пересчёт уходит в фоновый поток: номера
+страниц на короткое время приблизительны, зато запрос не ждёт COUNT.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _key(scope):
+    return f'feed-count:{scope}'
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1)
+        return _executor
+
+
+def _refresh(scope, generation, compute):
+    try:
+        cache.set(
+            _key(scope), (compute(), generation), settings.FEED_CACHE_TIMEOUT)
+    finally:
+        cache.delete(f'{_key(scope)}:refreshing')
+        connection.close()
+
+
+def cached(scope, generation, compute):
+    """Число строк ленты scope; compute() считает его по-настоящему."""
+    entry = cache.get(_key(scope))
+    if entry is not None and entry[1] == generation:
+        return entry[0]
+    if entry is None or not settings.FEED_COUNT_ASYNC:
+        count = compute()
+        cache.set(
+            _key(scope), (count, generation), settings.FEED_CACHE_TIMEOUT)
+        return count
+    # Пересчёт ставит в очередь только тот, кто первым взял отметку.
+    if cache.add(f'{_key(scope)}:refreshing', generation, 60):
+        _get_executor().submit(_refresh, scope, generation, compute)
+    return entry[0]
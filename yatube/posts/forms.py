@@ -1,4 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+from posts import images
 from posts.models import Post, Comment
 
 
@@ -11,6 +14,19 @@ class PostForm(forms.ModelForm):
             'group': forms.TextInput(attrs={'class': 'form-input'})
         }
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        # Уже сохранённая картинка при редактировании приходит FieldFile.
+        if isinstance(image, UploadedFile):
+            # ImageField проверяет только заголовок, а обрезанный файл
+            # или «бомба» не декодируются уже при перекодировании.
+            try:
+                return images.reencode(image)
+            except (OSError, Image.DecompressionBombError):
+                raise forms.ValidationError(
+                    'Файл повреждён или слишком велик.')
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
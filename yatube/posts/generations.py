@@ -0,0 +1,96 @@
+"""Поколения кэшированных фрагментов лент.
+
+Ключ фрагмента включает номер поколения своей области (главная, группа,
+автор, читатель ленты подписок). Любое изменение контента увеличивает
+номер, и старые фрагменты просто перестают запрашиваться, поэтому их
+можно хранить часами.
+"""
+from time import time
+
+from django.core.cache import cache
+
+from core.replicas import sync_point
+from posts.models import Post
+
+INDEX = 'index'
+
+
+def group(group_id):
+    return f'group:{group_id}'
+
+
+def author(author_id):
+    return f'author:{author_id}'
+
+
+def reader(user_id):
+    return f'reader:{user_id}'
+
+
+def post(post_id):
+    return f'post:{post_id}'
+
+
+def _key(scope):
+    return f'generation:{scope}'
+
+
+def _seed():
+    # После вытеснения ключа поколение начинается с отметки времени,
+    # чтобы не совпасть ни с одним из прежних номеров.
+    return int(time() * 1000)
+
+
+def get(*scopes):
+    """Текущие поколения областей одной строкой для ключа фрагмента."""
+    keys = [_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _seed(), None)
+            found[key] = cache.get(key)
+    # Страница с реплики устаревает вместе с ней, а не с поколением.
+    return '.'.join(str(found[key]) for key in keys) + sync_point()
+
+
+def bump(*scopes):
+    for scope in set(scopes):
+        try:
+            cache.incr(_key(scope))
+        except ValueError:
+            cache.set(_key(scope), _seed(), None)
+
+
+def post_changed(instance, previous_group_id=None):
+    scopes = [INDEX, post(instance.pk)]
+    for group_id in (instance.group_id, previous_group_id):
+        if group_id:
+            scopes.append(group(group_id))
+    if instance.author_id:
+        scopes.append(author(instance.author_id))
+    bump(*scopes)
+
+
+def comment_changed(comment):
+    scopes = [INDEX]
+    if comment.post_id:
+        scopes.append(post(comment.post_id))
+    bump(*scopes)
+
+
+def follow_changed(follow):
+    """Подписка меняет ленту читателя и счётчик в профиле автора."""
+    scopes = []
+    if follow.user_id:
+        scopes.append(reader(follow.user_id))
+    if follow.author_id:
+        scopes.append(author(follow.author_id))
+    bump(*scopes)
+
+
+def group_changed(group_id):
+    """Название и slug группы выводятся и на главной, и в профилях."""
+    author_ids = Post.objects.filter(
+        group_id=group_id, author__isnull=False
+    ).values_list('author_id', flat=True).order_by().distinct()
+    bump(INDEX, group(group_id), *map(author, author_ids))
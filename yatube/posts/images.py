@@ -0,0 +1,131 @@
+"""Обработка загруженных картинок постов до сохранения.
+
+Оригинал перекодируется: поворот по EXIF Orientation применяется к
+пикселям, а сами EXIF, GPS и комментарии камеры не сохраняются. Фото
+становится progressive JPEG не больше ORIGINAL_MAX_SIZE по длинной
+стороне, картинки с прозрачностью — PNG. GIF остаётся как есть, иначе
+пропала бы анимация.
+
+Одинаковые файлы хранятся один раз (posts.storage), поэтому здесь же
+ведётся счёт ссылок постов на файл.
+"""
+import os
+from functools import partial
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.db.models import F
+from PIL import Image, ImageOps
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from posts.models import Post, StoredImage
+from posts.storage import is_content_name
+
+ORIGINAL_MAX_SIZE = 2560
+JPEG_QUALITY = 85
+# Основной цвет ищется на уменьшенной копии среди стольких цветов.
+COLOR_SAMPLE_SIZE = 64
+COLOR_PALETTE = 5
+
+
+def reencode(upload):
+    """Новый файл для ImageField вместо загруженного upload."""
+    upload.seek(0)
+    with Image.open(upload) as original:
+        if original.format == 'GIF':
+            upload.seek(0)
+            return upload
+        # Профиль цвета нужен, только если пиксели остаются в RGB.
+        icc_profile = (
+            original.info.get('icc_profile')
+            if original.mode in ('RGB', 'RGBA') else None
+        )
+        image = ImageOps.exif_transpose(original)
+        image.thumbnail(
+            (ORIGINAL_MAX_SIZE, ORIGINAL_MAX_SIZE), Image.LANCZOS)
+        transparent = (
+            image.mode in ('RGBA', 'LA', 'PA')
+            or 'transparency' in image.info
+        )
+        params = {'icc_profile': icc_profile} if icc_profile else {}
+        if transparent:
+            format_, extension = 'PNG', 'png'
+            params['optimize'] = True
+        else:
+            format_, extension = 'JPEG', 'jpg'
+            image = image.convert('RGB')
+            params.update(
+                quality=JPEG_QUALITY, optimize=True, progressive=True)
+        buffer = BytesIO()
+        image.save(buffer, format_, **params)
+    name = f'{os.path.splitext(os.path.basename(upload.name))[0]}.{extension}'
+    return SimpleUploadedFile(
+        name, buffer.getvalue(), content_type=f'image/{format_.lower()}')
+
+
+def describe(file):
+    """Ширина, высота, размер в байтах и основной цвет '#rrggbb'
+    картинки file."""
+    file.seek(0)
+    with Image.open(file) as image:
+        meta = {
+            'image_width': image.width,
+            'image_height': image.height,
+            'image_bytes': file.size,
+            'image_color': '',
+        }
+        # Размеры известны из заголовка, а пиксели битого файла могут
+        # не декодироваться: тогда пост просто остаётся без цвета.
+        try:
+            sample = image.convert('RGB')
+        except OSError:
+            return meta
+    sample.thumbnail((COLOR_SAMPLE_SIZE, COLOR_SAMPLE_SIZE))
+    palette = sample.quantize(COLOR_PALETTE)
+    _, index = max(palette.getcolors())
+    red, green, blue = palette.getpalette()[index * 3:index * 3 + 3]
+    meta['image_color'] = f'#{red:02x}{green:02x}{blue:02x}'
+    return meta
+
+
+def acquire(name, count=1):
+    """Ещё count постов ссылаются на файл name."""
+    # Файлы со старыми именами хранилищу не принадлежат: их переносит
+    # migrate_images, а до того они не считаются и не удаляются.
+    if not is_content_name(name):
+        return
+    updated = StoredImage.objects.filter(name=name).update(
+        references=F('references') + count)
+    if not updated:
+        StoredImage.objects.create(name=name, references=count)
+
+
+def release(name):
+    """Пост больше не ссылается на name; последняя ссылка удаляет файл
+    вместе с миниатюрами после фиксации транзакции."""
+    if not is_content_name(name):
+        return
+    StoredImage.objects.filter(name=name, references__gt=0).update(
+        references=F('references') - 1)
+    transaction.on_commit(partial(collect, name))
+
+
+def collect(name):
+    """Удаляет файл name, если на него больше никто не ссылается.
+
+    Проверка счётчика, удаление строки и файла идут в одной пишущей
+    транзакции. Загрузка тех же байтов сохраняет файл и вызывает
+    acquire() внутри своей atomic(), а BEGIN IMMEDIATE
+    (SQLITE_TRANSACTION_MODE) не даёт им вклиниться между проверкой и
+    удалением: либо файл уже удалён и загрузка запишет его заново, либо
+    счётчик уже вырос и файл остаётся.
+    """
+    with transaction.atomic():
+        deleted, _ = StoredImage.objects.filter(
+            name=name, references=0).delete()
+        if not deleted:
+            return
+        default.kvstore.delete(ImageFile(name, default.storage))
+        Post._meta.get_field('image').storage.delete(name)
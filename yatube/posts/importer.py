@@ -0,0 +1,359 @@
+"""Пакетный импорт постов, комментариев и подписок из другой платформы.
+
+Записи читаются потоком из NDJSON или CSV и вставляются пачками через
+bulk_create, по транзакции на пачку. Пользователи и группы ищутся по
+словарям в памяти, отсутствующие пользователи создаются без пароля.
+
+bulk_create не вызывает сигналы, поэтому счётчики, ленты подписок и
+поколения кэша обновляются здесь же, по пачке за раз. Созданные посты
+и комментарии запоминаются в ImportRecord: после падения команду можно
+запустить заново, и уже загруженные записи будут пропущены.
+"""
+import csv
+import json
+import os
+import time
+from collections import Counter
+from functools import partial
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import counters, generations, images, timeline
+from posts.models import Comment, Follow, Group, ImportRecord, Post, Profile
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+TITLES = {
+    'posts': 'Посты',
+    'comments': 'Комментарии',
+    'follows': 'Подписки',
+}
+
+
+class ImportDataError(ValueError):
+    pass
+
+
+def read(path):
+    """Записи файла: CSV с заголовком или NDJSON, по расширению."""
+    with open(path, encoding='utf-8', newline='') as source:
+        if path.endswith('.csv'):
+            yield from csv.DictReader(source)
+            return
+        for number, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                raise ImportDataError(f'{path}:{number}: не JSON')
+
+
+def batches(records, size):
+    records = iter(records)
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_moment(value):
+    """Дата из записи или None, если её нет.
+
+    ValueError — дата не в формате ISO 8601 или невозможна
+    (2020-13-45): такая запись отклоняется, а не получает now().
+    """
+    if not value:
+        return None
+    moment = parse_datetime(value) if isinstance(value, str) else None
+    if moment is None:
+        raise ValueError(f'Неверная дата: {value!r}')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Stats:
+    def __init__(self, kind):
+        self.kind = kind
+        self.created = self.skipped = self.rejected = 0
+        self.started = time.monotonic()
+
+    def __str__(self):
+        elapsed = time.monotonic() - self.started
+        rate = self.created / elapsed if elapsed else 0
+        return (
+            f'{self.kind}: создано {self.created}, '
+            f'пропущено {self.skipped}, отклонено {self.rejected} '
+            f'за {elapsed:.1f} с ({rate:.0f} в секунду)'
+        )
+
+
+class Importer:
+    def __init__(self, media_dir='', batch_size=BATCH_SIZE, log=None):
+        self.media_dir = media_dir
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        self.storage = Post._meta.get_field('image').storage
+        self.copied = {}
+
+    def run(self, kind, records):
+        stats = Stats(TITLES[kind])
+        method = getattr(self, f'import_{kind}')
+        for batch in batches(records, self.batch_size):
+            with transaction.atomic():
+                method(batch, stats)
+            self.log(str(stats))
+        return stats
+
+    def resolve_users(self, usernames):
+        """Id пользователей по именам; недостающих создаёт без пароля."""
+        missing = {name for name in usernames if name} - set(self.users)
+        if missing:
+            User.objects.bulk_create(
+                [
+                    User(username=name, password=make_password(None))
+                    for name in missing
+                ],
+                ignore_conflicts=True,
+            )
+            created = dict(User.objects.filter(
+                username__in=missing).values_list('username', 'pk'))
+            Profile.objects.bulk_create(
+                [Profile(user_id=pk) for pk in created.values()],
+                ignore_conflicts=True,
+            )
+            self.users.update(created)
+        return self.users
+
+    def imported(self, kind, source_ids):
+        return dict(ImportRecord.objects.filter(
+            kind=kind, source_id__in=source_ids,
+        ).values_list('source_id', 'object_id'))
+
+    def fresh(self, kind, batch, stats):
+        """Записи пачки, которых ещё нет в ImportRecord, без повторов."""
+        done = self.imported(kind, [str(row.get('id')) for row in batch])
+        records = {}
+        for row in batch:
+            source_id = str(row.get('id') or '')
+            if not source_id:
+                stats.rejected += 1
+            elif source_id in done or source_id in records:
+                stats.skipped += 1
+            else:
+                records[source_id] = row
+        return records
+
+    def copy_image(self, name):
+        """Имя картинки в хранилище постов и поля image_* для неё.
+
+        Хранилище раскладывает файлы по содержимому, так что одинаковые
+        картинки из разных записей сохраняются один раз.
+        """
+        if not name:
+            return '', {}
+        if name not in self.copied:
+            self.copied[name] = self.store_image(name)
+        return self.copied[name]
+
+    def store_image(self, name):
+        path = os.path.join(self.media_dir, name)
+        if not os.path.isfile(path):
+            self.log(f'Нет файла изображения: {path}')
+            return '', {}
+        with open(path, 'rb') as source:
+            image = File(source)
+            try:
+                meta = images.describe(image)
+            except OSError:
+                self.log(f'Не изображение: {path}')
+                return '', {}
+            return self.storage.save(
+                f'posts/{os.path.basename(name)}', image), meta
+
+    def last_id(self, model):
+        """Последний выданный id таблицы.
+
+        Таблицы SQLite созданы с AUTOINCREMENT и не выдают заново id
+        удалённых постов: по ним в кэше и в ImportRecord может остаться
+        чужое состояние. Поэтому берётся sqlite_sequence, а не только
+        Max(pk). Вызывается внутри пишущей транзакции пачки.
+        """
+        last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        if connection.vendor != 'sqlite':
+            return last
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT seq FROM sqlite_sequence WHERE name = %s',
+                [model._meta.db_table])
+            row = cursor.fetchone()
+        return max(last, row[0] if row else 0)
+
+    def insert(self, model, objects, date_field, dates):
+        """bulk_create с заранее выданными id.
+
+        SQLite не возвращает id из bulk_create, а они нужны для
+        ImportRecord. auto_now_add затирает даты из источника, поэтому
+        они восстанавливаются отдельным bulk_update.
+        """
+        start = self.last_id(model) + 1
+        for pk, obj in enumerate(objects, start):
+            obj.pk = pk
+        model.objects.bulk_create(objects)
+        dated = []
+        for obj, date in zip(objects, dates):
+            if date is not None:
+                setattr(obj, date_field, date)
+                dated.append(obj)
+        if dated:
+            model.objects.bulk_update(dated, (date_field,))
+
+    def import_posts(self, batch, stats):
+        records = self.fresh(ImportRecord.POST, batch, stats)
+        users = self.resolve_users(
+            row.get('author') for row in records.values())
+        posts, sources, dates = [], [], []
+        for source_id, row in records.items():
+            group = row.get('group') or None
+            try:
+                moment = parse_moment(row.get('pub_date'))
+            except ValueError:
+                stats.rejected += 1
+                continue
+            if not row.get('text') or row.get('author') not in users or (
+                group and group not in self.groups
+            ):
+                stats.rejected += 1
+                continue
+            image, meta = self.copy_image(row.get('image'))
+            posts.append(Post(
+                text=row['text'],
+                author_id=users[row['author']],
+                group_id=self.groups.get(group),
+                image=image,
+                **meta,
+            ))
+            sources.append(source_id)
+            dates.append(moment)
+        if not posts:
+            return
+        self.insert(Post, posts, 'pub_date', dates)
+        ImportRecord.objects.bulk_create(
+            ImportRecord(kind=ImportRecord.POST, source_id=source_id,
+                         object_id=post.pk)
+            for source_id, post in zip(sources, posts)
+        )
+        counters.bump_each(
+            Profile.objects, 'user_id', 'posts_count',
+            Counter(post.author_id for post in posts))
+        for name, count in Counter(
+            post.image.name for post in posts if post.image
+        ).items():
+            images.acquire(name, count)
+        timeline.fan_out_many(posts)
+        self.bump_generations(
+            generations.INDEX,
+            *{generations.author(post.author_id) for post in posts},
+            *{generations.group(post.group_id)
+              for post in posts if post.group_id},
+        )
+        stats.created += len(posts)
+
+    def import_comments(self, batch, stats):
+        records = self.fresh(ImportRecord.COMMENT, batch, stats)
+        users = self.resolve_users(
+            row.get('author') for row in records.values())
+        posts = self.imported(
+            ImportRecord.POST,
+            [str(row.get('post')) for row in records.values()])
+        comments, sources, dates = [], [], []
+        for source_id, row in records.items():
+            post_id = posts.get(str(row.get('post')))
+            try:
+                moment = parse_moment(row.get('created'))
+            except ValueError:
+                stats.rejected += 1
+                continue
+            if (
+                not row.get('text') or post_id is None
+                or row.get('author') not in users
+            ):
+                stats.rejected += 1
+                continue
+            comments.append(Comment(
+                text=row['text'],
+                post_id=post_id,
+                author_id=users[row['author']],
+            ))
+            sources.append(source_id)
+            dates.append(moment)
+        if not comments:
+            return
+        self.insert(Comment, comments, 'created', dates)
+        ImportRecord.objects.bulk_create(
+            ImportRecord(kind=ImportRecord.COMMENT, source_id=source_id,
+                         object_id=comment.pk)
+            for source_id, comment in zip(sources, comments)
+        )
+        counters.bump_each(
+            Post.objects, 'pk', 'comment_count',
+            Counter(comment.post_id for comment in comments))
+        self.bump_generations(
+            *{generations.post(comment.post_id) for comment in comments})
+        stats.created += len(comments)
+
+    def import_follows(self, batch, stats):
+        users = self.resolve_users(
+            name for row in batch for name in (row.get('user'),
+                                               row.get('author')))
+        pairs = set()
+        for row in batch:
+            user_id = users.get(row.get('user'))
+            author_id = users.get(row.get('author'))
+            if user_id is None or author_id is None or user_id == author_id:
+                stats.rejected += 1
+            elif (user_id, author_id) in pairs:
+                stats.skipped += 1
+            else:
+                pairs.add((user_id, author_id))
+        existing = set(Follow.objects.filter(
+            user_id__in={user_id for user_id, _ in pairs},
+            author_id__in={author_id for _, author_id in pairs},
+        ).values_list('user_id', 'author_id'))
+        stats.skipped += len(pairs & existing)
+        pairs -= existing
+        if not pairs:
+            return
+        Follow.objects.bulk_create(
+            [Follow(user_id=user_id, author_id=author_id)
+             for user_id, author_id in pairs],
+            ignore_conflicts=True,
+        )
+        counters.bump_each(
+            Profile.objects, 'user_id', 'following_count',
+            Counter(user_id for user_id, _ in pairs))
+        counters.bump_each(
+            Profile.objects, 'user_id', 'followers_count',
+            Counter(author_id for _, author_id in pairs))
+        for user_id, author_id in pairs:
+            timeline.backfill(user_id, author_id)
+        self.bump_generations(
+            *{generations.reader(user_id) for user_id, _ in pairs},
+            *{generations.author(author_id) for _, author_id in pairs},
+        )
+        stats.created += len(pairs)
+
+    def bump_generations(self, *scopes):
+        transaction.on_commit(partial(generations.bump, *scopes))
@@ -0,0 +1,63 @@
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import generations, images
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Записывает размеры, вес и основной цвет картинок постам, '
+        'загруженным до появления этих полей. Каждый файл читается один '
+        'раз, даже если на него ссылаются несколько постов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        self.storage = Post._meta.get_field('image').storage
+        self.described = {}
+        self.missing = 0
+        last = updated = 0
+        while True:
+            posts = list(
+                Post.objects.filter(pk__gt=last, image_width__isnull=True)
+                .exclude(image='').order_by('pk')
+                .only('pk', 'image', 'author_id', 'group_id')
+                [:options['batch_size']]
+            )
+            if not posts:
+                break
+            last = posts[-1].pk
+            updated += self.fill(posts)
+        self.stdout.write(
+            f'Обновлено постов: {updated}, без файла: {self.missing}')
+
+    def fill(self, posts):
+        updated = 0
+        for post in posts:
+            meta = self.describe(post.image.name)
+            if meta is None:
+                self.missing += 1
+                continue
+            # Пост могли отредактировать после чтения пачки: размеры
+            # старого файла не должны затереть размеры новой картинки.
+            with transaction.atomic():
+                changed = Post.objects.filter(
+                    pk=post.pk, image=post.image.name).update(**meta)
+            if changed:
+                generations.post_changed(post)
+                updated += 1
+        return updated
+
+    def describe(self, name):
+        if name not in self.described:
+            try:
+                with self.storage.open(name) as file:
+                    self.described[name] = images.describe(file)
+            except (OSError, ValueError, SuspiciousFileOperation) as error:
+                self.stderr.write(f'{name}: {error}')
+                self.described[name] = None
+        return self.described[name]
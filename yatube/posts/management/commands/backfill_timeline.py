@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Заново раскладывает посты по лентам подписчиков.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--username',
+            help='Пересобрать ленту только этого пользователя.',
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Удалить существующие записи лент перед заполнением.',
+        )
+        parser.add_argument(
+            '--released',
+            action='store_true',
+            help='Только разложить посты авторов, у которых подписчиков '
+                 'стало меньше TIMELINE_PULL_THRESHOLD (для cron).',
+        )
+
+    def handle(self, *args, **options):
+        released = timeline.push_released()
+        self.stdout.write(f'Авторов снова в лентах: {released}')
+        if options['released']:
+            return
+        follows = Follow.objects.filter(
+            user__isnull=False, author__isnull=False)
+        entries = TimelineEntry.objects.all()
+        if options['username']:
+            follows = follows.filter(user__username=options['username'])
+            entries = entries.filter(user__username=options['username'])
+        if options['clear']:
+            entries.delete()
+        pairs = follows.values_list('user_id', 'author_id').order_by('pk')
+        total = 0
+        for user_id, author_id in pairs.iterator():
+            timeline.backfill(user_id, author_id)
+            total += 1
+        self.stdout.write(f'Обработано подписок: {total}')
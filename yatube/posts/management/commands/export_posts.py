@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты в NDJSON, по одному объекту на строку.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--author', help='Username автора.')
+        parser.add_argument('--group', help='Slug группы.')
+        parser.add_argument(
+            '--since', help='Посты не раньше этой даты (ISO 8601).')
+        parser.add_argument(
+            '--until', help='Посты раньше этой даты (ISO 8601).')
+        parser.add_argument(
+            '--after',
+            help='Курсор из последней выгруженной строки: продолжить '
+                 'выгрузку после неё.',
+        )
+        parser.add_argument(
+            '--output', help='Файл для выгрузки; по умолчанию stdout.')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=export.CHUNK_SIZE,
+            help='Сколько строк читать из базы за раз.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            posts = export.select(
+                author=options['author'],
+                group=options['group'],
+                since=options['since'],
+                until=options['until'],
+                after=options['after'],
+            )
+        except export.ExportError as error:
+            raise CommandError(error)
+        output = options['output']
+        # При дозаписи после обрыва старые строки не затираются.
+        stream = (
+            open(output, 'a', encoding='utf-8') if output else self.stdout)
+        exported = 0
+        try:
+            for line in export.ndjson(posts, options['chunk_size']):
+                stream.write(line)
+                exported += 1
+        finally:
+            if output:
+                stream.close()
+        self.stderr.write(f'Выгружено постов: {exported}')
@@ -0,0 +1,111 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore
+
+from posts import thumbnails
+from posts.models import Post
+
+CHECKPOINT_KEY = 'thumbnail-gc:after'
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет миниатюры, которые не нужны ни одному посту: от удалённых '
+        'постов, от заменённых картинок и от устаревших пресетов. Идёт по '
+        'KV-хранилищу sorl пачками и запоминает, где остановился.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько оригиналов проверять за пачку.')
+        parser.add_argument(
+            '--max-batches', type=int, default=None,
+            help='Остановиться после стольких пачек; следующий запуск '
+                 'продолжит с этого места.')
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать с начала, забыв сохранённую позицию.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, ничего не удаляя.')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.removed = self.reclaimed = checked = batches = 0
+        after = '' if options['restart'] else cache.get(CHECKPOINT_KEY, '')
+        prefix = add_prefix('', identity='thumbnails')
+        while options['max_batches'] is None or (
+            batches < options['max_batches']
+        ):
+            keys = list(
+                KVStore.objects.filter(key__startswith=prefix, key__gt=after)
+                .order_by('key')
+                .values_list('key', flat=True)[:options['batch_size']]
+            )
+            if not keys:
+                after = ''
+                break
+            sources = {
+                key: default.kvstore._get(key)
+                for key in map(del_prefix, keys)
+            }
+            # Живые имена читаются заново для каждой пачки: пост,
+            # загруженный во время долгого прохода, тоже считается.
+            live = set(Post.objects.filter(image__in=[
+                source.name for source in sources.values()
+                if source is not None
+            ]).values_list('image', flat=True))
+            garbage = []
+            for key, source in sources.items():
+                garbage += self.collect(key, source, live)
+            if garbage and not self.dry_run:
+                default.kvstore._delete_raw(*garbage)
+            checked += len(keys)
+            batches += 1
+            after = keys[-1]
+            if not self.dry_run:
+                cache.set(CHECKPOINT_KEY, after, None)
+        if not after and not self.dry_run:
+            cache.delete(CHECKPOINT_KEY)
+        self.stdout.write(
+            f'Проверено оригиналов: {checked}, удалено миниатюр: '
+            f'{self.removed}, освобождено байт: {self.reclaimed}'
+            + (', дошли до конца' if not after else ', продолжим позже')
+            + (' (пробный запуск)' if self.dry_run else ''))
+
+    def collect(self, key, source, live):
+        """Удаляет лишние миниатюры оригинала source и возвращает ключи
+        KV, которые больше не нужны."""
+        kvstore = default.kvstore
+        thumbnail_keys = kvstore._get(key, identity='thumbnails') or []
+        wanted = set()
+        if source is not None and source.name in live:
+            wanted = thumbnails.expected(source.name)
+        kept, garbage = [], []
+        for thumbnail_key in thumbnail_keys:
+            thumbnail = kvstore._get(thumbnail_key)
+            if thumbnail is not None and thumbnail.name in wanted:
+                kept.append(thumbnail_key)
+                continue
+            garbage.append(add_prefix(thumbnail_key))
+            if thumbnail is not None:
+                self.delete_file(thumbnail)
+        if not kept:
+            garbage.append(add_prefix(key, identity='thumbnails'))
+            if source is not None and source.name not in live:
+                garbage.append(add_prefix(key))
+        elif garbage and not self.dry_run:
+            kvstore._set(key, kept, identity='thumbnails')
+        return garbage
+
+    def delete_file(self, thumbnail):
+        storage = thumbnail.storage
+        if not storage.exists(thumbnail.name):
+            return
+        self.reclaimed += storage.size(thumbnail.name)
+        self.removed += 1
+        if not self.dry_run:
+            storage.delete(thumbnail.name)
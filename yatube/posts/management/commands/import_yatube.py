@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import importer
+
+# Подписки грузятся первыми: тогда новые посты сразу раскладываются
+# по лентам, а не добираются потом поштучным backfill.
+KINDS = ('follows', 'posts', 'comments')
+
+
+class Command(BaseCommand):
+    help = (
+        'Пакетно загружает подписки, посты и комментарии из NDJSON или '
+        'CSV. Повторный запуск пропускает уже загруженные записи.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts',
+            help='Посты: id, author, group, text, pub_date, image.',
+        )
+        parser.add_argument(
+            '--comments',
+            help='Комментарии: id, post (id поста в источнике), author, '
+                 'text, created.',
+        )
+        parser.add_argument('--follows', help='Подписки: user, author.')
+        parser.add_argument(
+            '--media-dir',
+            default='',
+            help='Каталог, относительно которого указаны пути картинок.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=importer.BATCH_SIZE,
+            help='Сколько записей вставлять в одной транзакции.',
+        )
+
+    def handle(self, *args, **options):
+        if not any(options[kind] for kind in KINDS):
+            raise CommandError('Укажите хотя бы один из --posts, '
+                               '--comments, --follows.')
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        loader = importer.Importer(
+            media_dir=options['media_dir'],
+            batch_size=options['batch_size'],
+            log=log,
+        )
+        for kind in KINDS:
+            if not options[kind]:
+                continue
+            try:
+                stats = loader.run(kind, importer.read(options[kind]))
+            except (OSError, importer.ImportDataError) as error:
+                raise CommandError(error)
+            self.stdout.write(str(stats))
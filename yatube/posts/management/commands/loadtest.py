@@ -0,0 +1,248 @@
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.middleware.csrf import CSRF_TOKEN_LENGTH
+from django.test import Client
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from posts.models import Group, Post
+
+User = get_user_model()
+
+# Доли сценариев в смеси запросов: чтения преобладают, как в жизни.
+MIX = {
+    'index': 30,
+    'group_posts': 15,
+    'profile': 15,
+    'post_detail': 20,
+    'follow_index': 10,
+    'post_create': 4,
+    'add_comment': 4,
+    'profile_follow': 2,
+}
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(share * len(values)) - 1)]
+
+
+class Worker:
+    """Один «пользователь» замкнутого цикла со своей сессией.
+
+    Запросы идут прямо в WSGI-приложение проекта, с CSRF и всеми
+    middleware, как от настоящего сервера.
+    """
+
+    def __init__(self, application, sample, seed, session):
+        self.application = application
+        self.random = random.Random(seed)
+        self.sample = sample
+        self.csrf_token = get_random_string(CSRF_TOKEN_LENGTH)
+        self.cookie = (
+            f'{settings.SESSION_COOKIE_NAME}={session}; '
+            f'{settings.CSRF_COOKIE_NAME}={self.csrf_token}'
+        )
+
+    def call(self, method, path, data=None):
+        body = b''
+        query = ''
+        if method == 'POST':
+            body = urlencode(
+                dict(data, csrfmiddlewaretoken=self.csrf_token)).encode()
+        elif data:
+            query = urlencode(data)
+        environ = {}
+        setup_testing_defaults(environ)
+        environ.update({
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'HTTP_COOKIE': self.cookie,
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': BytesIO(body),
+        })
+        status = []
+        response = self.application(
+            environ, lambda code, headers: status.append(code))
+        try:
+            for _ in response:
+                pass
+        finally:
+            response.close()
+        return int(status[0].split()[0])
+
+    def request(self, scenario):
+        choice = self.random.choice
+        page = {'page': self.random.randint(1, 3)}
+        if scenario == 'index':
+            return self.call('GET', reverse('posts:index'), page)
+        if scenario == 'group_posts':
+            return self.call('GET', reverse(
+                'posts:group_list', args=(choice(self.sample['groups']),)),
+                page)
+        if scenario == 'profile':
+            return self.call('GET', reverse(
+                'posts:profile', args=(choice(self.sample['usernames']),)),
+                page)
+        if scenario == 'post_detail':
+            return self.call('GET', reverse(
+                'posts:post_detail', args=(choice(self.sample['posts']),)))
+        if scenario == 'follow_index':
+            return self.call('GET', reverse('posts:follow_index'), page)
+        if scenario == 'post_create':
+            return self.call(
+                'POST', reverse('posts:post_create'),
+                {'text': 'Нагрузочный пост'})
+        if scenario == 'add_comment':
+            return self.call('POST', reverse(
+                'posts:add_comment', args=(choice(self.sample['posts']),)),
+                {'text': 'Нагрузочный комментарий'})
+        return self.call('GET', reverse(
+            'posts:profile_follow',
+            args=(choice(self.sample['usernames']),)))
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает представления posts через WSGI-приложение из пула '
+        'потоков и печатает JSON с пропускной способностью, перцентилями '
+        'задержки и числом SQL-запросов на запрос.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=4,
+            help='Сколько клиентов работает одновременно.')
+        parser.add_argument(
+            '--requests', type=int, default=1000,
+            help='Сколько запросов выполнить всего.')
+        parser.add_argument(
+            '--read-only', action='store_true',
+            help='Не вызывать представления, которые пишут в базу.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        users = list(User.objects.order_by('?')[:200])
+        sample = {
+            'usernames': [user.username for user in users],
+            'groups': list(
+                Group.objects.values_list('slug', flat=True)[:200]),
+            'posts': list(Post.objects.order_by('?').values_list(
+                'pk', flat=True)[:1000]),
+        }
+        if not all(sample.values()):
+            raise CommandError(
+                'Нужны пользователи, группы и посты: запустите seed.')
+        application = get_wsgi_application()
+        workers = []
+        for i in range(options['threads']):
+            client = Client()
+            client.force_login(users[i % len(users)])
+            workers.append(Worker(
+                application, sample, options['seed'] + i,
+                client.cookies[settings.SESSION_COOKIE_NAME].value,
+            ))
+        mix = {
+            name: weight for name, weight in MIX.items()
+            if not options['read_only'] or name not in (
+                'post_create', 'add_comment', 'profile_follow')
+        }
+        self.results = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+        self.remaining = options['requests']
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['threads']) as pool:
+            for future in [
+                pool.submit(self.loop, worker, mix) for worker in workers
+            ]:
+                future.result()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(json.dumps(
+            self.report(elapsed, options['threads']),
+            ensure_ascii=False, indent=2))
+
+    def take(self):
+        with self.lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def loop(self, worker, mix):
+        names, weights = list(mix), list(mix.values())
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        try:
+            while self.take():
+                scenario = worker.random.choices(names, weights)[0]
+                queries.clear()
+                with connection.execute_wrapper(count):
+                    began = time.perf_counter()
+                    try:
+                        failed = worker.request(scenario) >= 400
+                    except Exception:
+                        failed = True
+                    latency = time.perf_counter() - began
+                with self.lock:
+                    if failed:
+                        self.errors[scenario] += 1
+                    else:
+                        self.results[scenario].append(
+                            (latency, len(queries)))
+        finally:
+            connection.close()
+
+    def report(self, elapsed, threads):
+        def summary(results):
+            if not results:
+                return {'requests': 0}
+            latencies = sorted(latency for latency, _ in results)
+            return {
+                'requests': len(results),
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+                'queries_per_request': round(
+                    sum(count for _, count in results) / len(results), 2),
+            }
+
+        everything = [
+            result for results in self.results.values() for result in results
+        ]
+        total = len(everything) + sum(self.errors.values())
+        return {
+            'threads': threads,
+            'requests': total,
+            'errors': sum(self.errors.values()),
+            'seconds': round(elapsed, 3),
+            'throughput_rps': round(total / elapsed, 1) if elapsed else None,
+            'overall': summary(everything),
+            'views': {
+                name: dict(
+                    summary(self.results[name]), errors=self.errors[name])
+                for name in sorted(set(self.results) | set(self.errors))
+            },
+        }
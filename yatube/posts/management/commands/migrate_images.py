@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import generations, images
+from posts.models import Post
+from posts.storage import is_content_name
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов в хранилище с именами по содержимому. '
+        'Сайт при этом работает: новый файл пишется раньше, чем пост '
+        'переключается на него, посты переключаются короткими '
+        'транзакциями, а старые файлы остаются до --delete-old.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--delete-old', action='store_true',
+            help='После переноса удалить старые файлы. Запускайте, когда '
+                 'старые адреса уже не встречаются в закэшированных '
+                 'страницах.')
+
+    def handle(self, *args, **options):
+        self.storage = Post._meta.get_field('image').storage
+        self.moved = {}
+        last = switched = 0
+        while True:
+            posts = list(
+                Post.objects.filter(pk__gt=last).exclude(image='')
+                .order_by('pk')
+                .only('pk', 'image', 'author_id', 'group_id')
+                [:options['batch_size']]
+            )
+            if not posts:
+                break
+            last = posts[-1].pk
+            switched += self.switch(posts)
+        deleted = self.delete_old() if options['delete_old'] else 0
+        unique = len(set(name for name in self.moved.values() if name))
+        self.stdout.write(
+            f'Перенесено постов: {switched}, файлов было: '
+            f'{len(self.moved)}, стало: {unique}, удалено старых: {deleted}')
+
+    def switch(self, posts):
+        switched = 0
+        for post in posts:
+            old = post.image.name
+            if is_content_name(old):
+                continue
+            # Файл пишется в той же транзакции, что и ссылка на него:
+            # collect() не удалит его между этими шагами.
+            with transaction.atomic():
+                new = self.move(old)
+                # Пост могли отредактировать после чтения пачки: тогда
+                # его новая картинка остаётся, а ссылка не считается.
+                updated = new and Post.objects.filter(
+                    pk=post.pk, image=old).update(image=new)
+                if updated:
+                    images.acquire(new)
+            if updated:
+                post.image.name = new
+                generations.post_changed(post)
+                switched += 1
+        return switched
+
+    def delete_old(self):
+        deleted = 0
+        for old, new in self.moved.items():
+            if new and old != new and self.storage.exists(old):
+                self.storage.delete(old)
+                deleted += 1
+        return deleted
+
+    def move(self, name):
+        moved = self.moved.get(name)
+        # Перенесённый раньше файл могли уже собрать вместе со ссылками.
+        if name in self.moved and (
+            moved is None or self.storage.exists(moved)
+        ):
+            return moved
+        if not self.storage.exists(name):
+            self.stderr.write(f'Нет файла {name}, пост пропущен')
+            moved = None
+        else:
+            with self.storage.open(name) as content:
+                moved = self.storage.save(name, content)
+        self.moved[name] = moved
+        return moved
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+
+from posts.models import Comment, Post
+
+# Таблица индекса, запрос заполнения куска id и модель с этими id.
+INDEXES = (
+    (
+        'posts_post_fts',
+        'INSERT INTO posts_post_fts (rowid, text) '
+        'SELECT id, text FROM posts_post WHERE id >= %s AND id < %s',
+        Post,
+    ),
+    (
+        'posts_comment_fts',
+        'INSERT INTO posts_comment_fts (rowid, text, post_id) '
+        'SELECT id, text, post_id FROM posts_comment '
+        'WHERE id >= %s AND id < %s',
+        Comment,
+    ),
+)
+
+
+class Command(BaseCommand):
+    help = 'Заново строит полнотекстовый индекс постов и комментариев.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько строк индексировать в одной транзакции.',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        for table, reindex, model in INDEXES:
+            last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {table}')
+            for start in range(0, last + 1, chunk_size):
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute(reindex, [start, start + chunk_size])
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {table} ({table}) VALUES ('optimize')")
+                cursor.execute(f'SELECT COUNT(*) FROM {table}')
+                total = cursor.fetchone()[0]
+            self.stdout.write(f'{table}: проиндексировано строк: {total}')
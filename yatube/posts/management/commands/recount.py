@@ -0,0 +1,96 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max
+
+from posts.models import Comment, Follow, Post, Profile
+
+User = get_user_model()
+
+
+def totals(queryset, field):
+    return dict(
+        queryset.values_list(field).annotate(Count('pk')).order_by())
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов, комментариев и подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько строк пересчитывать в одной транзакции.',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        fixed = 0
+        for start, stop in self.chunks(User, chunk_size):
+            fixed += self.recount_profiles(start, stop)
+        for start, stop in self.chunks(Post, chunk_size):
+            fixed += self.recount_posts(start, stop)
+        self.stdout.write(f'Исправлено счётчиков: {fixed}')
+
+    def chunks(self, model, chunk_size):
+        last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        for start in range(0, last + 1, chunk_size):
+            yield start, start + chunk_size
+
+    @transaction.atomic
+    def recount_profiles(self, start, stop):
+        user_ids = User.objects.filter(
+            pk__gte=start, pk__lt=stop).values_list('pk', flat=True)
+        Profile.objects.bulk_create(
+            [Profile(user_id=user_id) for user_id in user_ids],
+            ignore_conflicts=True,
+        )
+        posts = totals(
+            Post.objects.filter(author__gte=start, author__lt=stop),
+            'author')
+        followers = totals(
+            Follow.objects.filter(author__gte=start, author__lt=stop),
+            'author')
+        following = totals(
+            Follow.objects.filter(user__gte=start, user__lt=stop), 'user')
+        changed = []
+        profiles = Profile.objects.select_for_update().filter(
+            user__gte=start, user__lt=stop)
+        for profile in profiles:
+            actual = (
+                posts.get(profile.user_id, 0),
+                followers.get(profile.user_id, 0),
+                following.get(profile.user_id, 0),
+            )
+            if actual != (
+                profile.posts_count,
+                profile.followers_count,
+                profile.following_count,
+            ):
+                (
+                    profile.posts_count,
+                    profile.followers_count,
+                    profile.following_count,
+                ) = actual
+                changed.append(profile)
+        Profile.objects.bulk_update(
+            changed,
+            ('posts_count', 'followers_count', 'following_count'),
+        )
+        return len(changed)
+
+    @transaction.atomic
+    def recount_posts(self, start, stop):
+        comments = totals(
+            Comment.objects.filter(post__gte=start, post__lt=stop), 'post')
+        changed = []
+        posts = Post.objects.select_for_update().filter(
+            pk__gte=start, pk__lt=stop).only('comment_count')
+        for post in posts:
+            actual = comments.get(post.pk, 0)
+            if post.comment_count != actual:
+                post.comment_count = actual
+                changed.append(post)
+        Post.objects.bulk_update(changed, ('comment_count',))
+        return len(changed)
@@ -0,0 +1,115 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts import importer
+from posts.models import Group
+
+WORDS = (
+    'кот', 'лента', 'город', 'утро', 'книга', 'дорога', 'река', 'песня',
+    'кофе', 'друг', 'поезд', 'море', 'код', 'сад', 'зима', 'письмо',
+    'вечер', 'окно', 'гора', 'фото', 'ветер', 'день', 'мост',
+)
+
+
+def zipf_weights(count, alpha):
+    """Веса степенного закона: i-й по популярности весит 1 / i**alpha."""
+    return [1 / rank ** alpha for rank in range(1, count + 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Наполняет базу пользователями, группами, постами и комментариями '
+        'для нагрузочных замеров. Подписки и авторство распределены по '
+        'степенному закону: немногие авторы собирают большую часть '
+        'подписчиков и постов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--follows',
+            type=int,
+            default=20,
+            help='Среднее число подписок на пользователя.',
+        )
+        parser.add_argument(
+            '--alpha',
+            type=float,
+            default=1.1,
+            help='Показатель степенного закона популярности авторов.',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0, help='Зерно генератора.')
+        parser.add_argument(
+            '--batch-size', type=int, default=importer.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        # Метка прогона в id источника: повторный seed добавляет новые
+        # посты, а не пропускает их как уже загруженные.
+        self.run_id = f'seed:{timezone.now():%Y%m%d%H%M%S}:{options["seed"]}'
+        self.usernames = [f'user{i}' for i in range(options['users'])]
+        self.weights = zipf_weights(len(self.usernames), options['alpha'])
+        Group.objects.bulk_create(
+            [
+                Group(title=f'Группа {i}', slug=f'group-{i}',
+                      description='Сгенерирована командой seed')
+                for i in range(options['groups'])
+            ],
+            ignore_conflicts=True,
+        )
+        self.slugs = [f'group-{i}' for i in range(options['groups'])]
+        loader = importer.Importer(
+            batch_size=options['batch_size'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        for kind, records in (
+            ('follows', self.follows(options['follows'])),
+            ('posts', self.posts(options['posts'])),
+            ('comments', self.comments(
+                options['comments'], options['posts'])),
+        ):
+            self.stdout.write(str(loader.run(kind, records)))
+
+    def text(self, low, high):
+        return ' '.join(
+            self.random.choice(WORDS)
+            for _ in range(self.random.randint(low, high))
+        ).capitalize()
+
+    def follows(self, average):
+        for user in self.usernames:
+            count = self.random.randint(0, 2 * average)
+            for author in self.random.choices(
+                self.usernames, self.weights, k=count
+            ):
+                yield {'user': user, 'author': author}
+
+    def posts(self, count):
+        now = timezone.now()
+        authors = self.random.choices(self.usernames, self.weights, k=count)
+        for i, author in enumerate(authors):
+            yield {
+                'id': f'{self.run_id}:post:{i}',
+                'author': author,
+                'group': self.random.choice(self.slugs + [None]),
+                'text': self.text(5, 60),
+                'pub_date': (
+                    now - timedelta(minutes=self.random.randint(0, 525600))
+                ).isoformat(),
+            }
+
+    def comments(self, count, posts):
+        for i in range(count if posts else 0):
+            yield {
+                'id': f'{self.run_id}:comment:{i}',
+                'post': f'{self.run_id}:post:{self.random.randrange(posts)}',
+                'author': self.random.choice(self.usernames),
+                'text': self.text(2, 15),
+            }
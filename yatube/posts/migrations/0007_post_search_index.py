@@ -0,0 +1,55 @@
+# Полнотекстовый индекс FTS5 по тексту постов и их комментариям.
+
+from django.db import migrations
+
+COMMENTS = (
+    "(SELECT group_concat(text, ' ') FROM posts_comment "
+    "WHERE post_id = {post})"
+)
+NEW_COMMENTS = COMMENTS.format(post='new.post_id')
+OLD_COMMENTS = COMMENTS.format(post='old.post_id')
+
+FORWARD = [
+    'CREATE VIRTUAL TABLE posts_post_fts USING fts5(text, comments)',
+    'CREATE TRIGGER posts_post_fts_insert AFTER INSERT ON posts_post BEGIN '
+    'INSERT INTO posts_post_fts (rowid, text, comments) '
+    "VALUES (new.id, new.text, ''); END",
+    'CREATE TRIGGER posts_post_fts_update AFTER UPDATE OF text ON posts_post '
+    'BEGIN UPDATE posts_post_fts SET text = new.text '
+    'WHERE rowid = new.id; END',
+    'CREATE TRIGGER posts_post_fts_delete AFTER DELETE ON posts_post BEGIN '
+    'DELETE FROM posts_post_fts WHERE rowid = old.id; END',
+    'CREATE TRIGGER posts_comment_fts_insert AFTER INSERT ON posts_comment '
+    'BEGIN UPDATE posts_post_fts SET comments = {} '
+    'WHERE rowid = new.post_id; END'.format(NEW_COMMENTS),
+    'CREATE TRIGGER posts_comment_fts_update AFTER UPDATE OF text '
+    'ON posts_comment BEGIN UPDATE posts_post_fts SET comments = {} '
+    'WHERE rowid = new.post_id; END'.format(NEW_COMMENTS),
+    'CREATE TRIGGER posts_comment_fts_delete AFTER DELETE ON posts_comment '
+    'BEGIN UPDATE posts_post_fts SET comments = {} '
+    'WHERE rowid = old.post_id; END'.format(OLD_COMMENTS),
+    'INSERT INTO posts_post_fts (rowid, text, comments) '
+    'SELECT id, text, {} FROM posts_post'.format(
+        COMMENTS.format(post='posts_post.id')),
+]
+
+BACKWARD = [
+    'DROP TRIGGER posts_comment_fts_delete',
+    'DROP TRIGGER posts_comment_fts_update',
+    'DROP TRIGGER posts_comment_fts_insert',
+    'DROP TRIGGER posts_post_fts_delete',
+    'DROP TRIGGER posts_post_fts_update',
+    'DROP TRIGGER posts_post_fts_insert',
+    'DROP TABLE posts_post_fts',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_auto_20261018_1910'),
+    ]
+
+    operations = [
+        migrations.RunSQL(FORWARD, BACKWARD),
+    ]
@@ -0,0 +1,55 @@
+# Размеры, вес и основной цвет картинки поста.
+#
+# Колонки добавляются ALTER TABLE: AddField в SQLite пересоздал бы
+# posts_post, то есть скопировал бы всю таблицу и потерял триггеры
+# полнотекстового индекса.
+
+from django.db import migrations, models
+
+COLUMNS = (
+    ('image_width', 'integer unsigned NULL'),
+    ('image_height', 'integer unsigned NULL'),
+    ('image_bytes', 'integer unsigned NULL'),
+    ('image_color', "varchar(7) NOT NULL DEFAULT ''"),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_storedimage'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    f'ALTER TABLE posts_post ADD COLUMN "{name}" {definition}',
+                    f'ALTER TABLE posts_post DROP COLUMN "{name}"',
+                )
+                for name, definition in COLUMNS
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='post',
+                    name='image_width',
+                    field=models.PositiveIntegerField(editable=False, null=True, verbose_name='Ширина картинки'),
+                ),
+                migrations.AddField(
+                    model_name='post',
+                    name='image_height',
+                    field=models.PositiveIntegerField(editable=False, null=True, verbose_name='Высота картинки'),
+                ),
+                migrations.AddField(
+                    model_name='post',
+                    name='image_bytes',
+                    field=models.PositiveIntegerField(editable=False, null=True, verbose_name='Размер файла картинки'),
+                ),
+                migrations.AddField(
+                    model_name='post',
+                    name='image_color',
+                    field=models.CharField(blank=True, editable=False, max_length=7, verbose_name='Основной цвет картинки'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Ленты подписок для подписок, сделанных до появления TimelineEntry:
+# без этого после развёртывания лента подписок пуста, пока не запустят
+# backfill_timeline.
+
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def fill_timelines(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    Profile = apps.get_model('posts', 'Profile')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    # Посты популярных авторов читаются на лету и в ленты не попадают.
+    pulled = set(Profile.objects.filter(
+        followers_count__gte=settings.TIMELINE_PULL_THRESHOLD,
+    ).values_list('user_id', flat=True))
+    posts = {}
+    batch = []
+    follows = Follow.objects.filter(
+        user__isnull=False, author__isnull=False,
+    ).values_list('user_id', 'author_id')
+    for user_id, author_id in follows.iterator():
+        if author_id in pulled:
+            continue
+        if author_id not in posts:
+            posts[author_id] = list(Post.objects.filter(
+                author_id=author_id).values_list('pk', 'pub_date'))
+        for post_id, pub_date in posts[author_id]:
+            batch.append(TimelineEntry(
+                user_id=user_id, post_id=post_id, author_id=author_id,
+                pub_date=pub_date))
+            if len(batch) >= BATCH_SIZE:
+                TimelineEntry.objects.bulk_create(
+                    batch, ignore_conflicts=True)
+                batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_image_meta'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
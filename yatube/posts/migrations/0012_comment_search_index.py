@@ -0,0 +1,61 @@
+# Комментарии индексируются своими строками в posts_comment_fts.
+#
+# В 0007 комментарии лежали склеенными в строке поста, и каждый новый
+# комментарий заново склеивал все остальные: O(n) на запись и O(n²) на
+# обсуждение. Теперь запись — одна строка индекса, а посты с
+# комментариями собираются при поиске (posts.search).
+
+from importlib import import_module
+
+from django.db import migrations
+
+initial = import_module('posts.migrations.0007_post_search_index')
+
+FORWARD = [
+    *initial.BACKWARD,
+    'CREATE VIRTUAL TABLE posts_post_fts USING fts5(text)',
+    'CREATE TRIGGER posts_post_fts_insert AFTER INSERT ON posts_post BEGIN '
+    'INSERT INTO posts_post_fts (rowid, text) VALUES (new.id, new.text); '
+    'END',
+    'CREATE TRIGGER posts_post_fts_update AFTER UPDATE OF text ON posts_post '
+    'BEGIN UPDATE posts_post_fts SET text = new.text '
+    'WHERE rowid = new.id; END',
+    'CREATE TRIGGER posts_post_fts_delete AFTER DELETE ON posts_post BEGIN '
+    'DELETE FROM posts_post_fts WHERE rowid = old.id; END',
+    'CREATE VIRTUAL TABLE posts_comment_fts '
+    'USING fts5(text, post_id UNINDEXED)',
+    'CREATE TRIGGER posts_comment_fts_insert AFTER INSERT ON posts_comment '
+    'BEGIN INSERT INTO posts_comment_fts (rowid, text, post_id) '
+    'VALUES (new.id, new.text, new.post_id); END',
+    'CREATE TRIGGER posts_comment_fts_update AFTER UPDATE OF text, post_id '
+    'ON posts_comment BEGIN UPDATE posts_comment_fts '
+    'SET text = new.text, post_id = new.post_id WHERE rowid = new.id; END',
+    'CREATE TRIGGER posts_comment_fts_delete AFTER DELETE ON posts_comment '
+    'BEGIN DELETE FROM posts_comment_fts WHERE rowid = old.id; END',
+    'INSERT INTO posts_post_fts (rowid, text) SELECT id, text FROM posts_post',
+    'INSERT INTO posts_comment_fts (rowid, text, post_id) '
+    'SELECT id, text, post_id FROM posts_comment',
+]
+
+BACKWARD = [
+    'DROP TRIGGER posts_comment_fts_delete',
+    'DROP TRIGGER posts_comment_fts_update',
+    'DROP TRIGGER posts_comment_fts_insert',
+    'DROP TABLE posts_comment_fts',
+    'DROP TRIGGER posts_post_fts_delete',
+    'DROP TRIGGER posts_post_fts_update',
+    'DROP TRIGGER posts_post_fts_insert',
+    'DROP TABLE posts_post_fts',
+    *initial.FORWARD,
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_fill_timelines'),
+    ]
+
+    operations = [
+        migrations.RunSQL(FORWARD, BACKWARD),
+    ]
@@ -0,0 +1,34 @@
+# Популярный автор остаётся в чтении на лету, пока backfill_timeline не
+# разложит его посты по лентам, а подписка кладёт в ленту только
+# последние посты автора.
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pulled(apps, schema_editor):
+    Profile = apps.get_model('posts', 'Profile')
+    Profile.objects.filter(
+        followers_count__gte=settings.TIMELINE_PULL_THRESHOLD,
+    ).update(timeline_pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_comment_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='follow',
+            name='timeline_since',
+            field=models.DateTimeField(blank=True, help_text='Посты автора старше этой даты лента читает на лету', null=True, verbose_name='Начало ленты'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='timeline_pulled',
+            field=models.BooleanField(default=False, verbose_name='Посты читаются на лету'),
+        ),
+        migrations.RunPython(mark_pulled, migrations.RunPython.noop),
+    ]
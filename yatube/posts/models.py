@@ -1,8 +1,23 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 
+from posts.storage import ContentAddressedStorage
+
 User = get_user_model()
 
+# Колонки, которые ленты никогда не выводят: их незачем тянуть из JOIN.
+FEED_DEFERRED_FIELDS = (
+    'author__password',
+    'author__last_login',
+    'author__is_superuser',
+    'author__is_staff',
+    'author__is_active',
+    'author__email',
+    'author__date_joined',
+    'group__description',
+)
+
 
 class Group(models.Model):
     title = models.CharField(verbose_name='Заголовок', max_length=200)
@@ -13,6 +28,42 @@ class Group(models.Model):
         return f'{self.title}'
 
 
+def seek(queryset, position, backwards, id_field='pk', date_field='pub_date'):
+    """Упорядочивает queryset по (date_field, id_field) от новых к старым
+    и отрезает всё, что не дальше позиции в выбранном направлении."""
+    if backwards:
+        queryset = queryset.order_by(date_field, id_field)
+    else:
+        queryset = queryset.order_by(f'-{date_field}', f'-{id_field}')
+    if position is None:
+        return queryset
+    date, pk = position
+    lookup = 'gt' if backwards else 'lt'
+    # Нестрогое условие по дате отдаёт индексу границу диапазона,
+    # строгое отсекает уже показанные строки с той же датой.
+    return queryset.filter(**{f'{date_field}__{lookup}e': date}).filter(
+        Q(**{f'{date_field}__{lookup}': date})
+        | Q(**{f'{id_field}__{lookup}': pk})
+    )
+
+
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        """Посты для списков без N+1: автор и группа приходят JOIN-ом,
+        число комментариев хранится в самом посте."""
+        return self.select_related('author', 'group').defer(
+            *FEED_DEFERRED_FIELDS)
+
+    def seek(self, position=None, backwards=False):
+        """Keyset-срез ленты после позиции (pub_date, pk).
+
+        Порядок совпадает с Meta.ordering, а pk разрешает совпадения
+        дат, поэтому страница с любым номером читается одним
+        индексным диапазоном без OFFSET.
+        """
+        return seek(self, position, backwards)
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст поста',
@@ -41,18 +92,61 @@ class Post(models.Model):
         verbose_name='Картинка',
         help_text='Выберите картинку',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    # Заполняются при загрузке (posts.images.describe), чтобы шаблоны
+    # не открывали файл ради размеров.
+    image_width = models.PositiveIntegerField(
+        verbose_name='Ширина картинки', null=True, editable=False)
+    image_height = models.PositiveIntegerField(
+        verbose_name='Высота картинки', null=True, editable=False)
+    image_bytes = models.PositiveIntegerField(
+        verbose_name='Размер файла картинки', null=True, editable=False)
+    image_color = models.CharField(
+        verbose_name='Основной цвет картинки', max_length=7, blank=True,
+        editable=False)
+    comment_count = models.PositiveIntegerField(
+        verbose_name='Число комментариев',
+        default=0,
+        editable=False,
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'), name='post_date_idx'),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='post_author_date_idx',
+            ),
+            models.Index(
+                fields=('group', '-pub_date', '-id'),
+                name='post_group_date_idx',
+            ),
+        )
 
     def __str__(self):
         return self.text[:15]
 
 
+class CommentQuerySet(models.QuerySet):
+    def thread(self):
+        return self.select_related('author').defer(*(
+            field for field in FEED_DEFERRED_FIELDS
+            if field.startswith('author__')
+        ))
+
+    def seek(self, position=None, backwards=False):
+        # Комментарии читаются от старых к новым, поэтому «вперёд» здесь —
+        # это обратный порядок общей функции seek.
+        return seek(self, position, not backwards, date_field='created')
+
+
 class Comment(models.Model):
     post = models.ForeignKey(
         Post,
@@ -78,6 +172,14 @@ class Comment(models.Model):
         auto_now_add=True
     )
 
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=('post', 'created'), name='comment_post_created_idx'),
+        )
+
     def __str__(self):
         return self.text[:20]
 
@@ -97,12 +199,141 @@ class Follow(models.Model):
         verbose_name='Автор',
         null=True,
     )
+    timeline_since = models.DateTimeField(
+        verbose_name='Начало ленты',
+        help_text='Посты автора старше этой даты лента читает на лету',
+        blank=True, null=True,
+    )
 
     class Meta:
         constraints = (
             models.UniqueConstraint(
                 fields=('author', 'user'), name='unique_following'),
         )
+        indexes = (
+            models.Index(
+                fields=('user', 'author'), name='follow_user_author_idx'),
+        )
 
     def __str__(self):
         return f'{self.user} подписан на {self.author}'
+
+
+class Profile(models.Model):
+    """Счётчики пользователя, которые иначе пришлось бы считать COUNT-ом."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='profile',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Число подписчиков', default=0)
+    following_count = models.PositiveIntegerField(
+        verbose_name='Число подписок', default=0)
+    timeline_pulled = models.BooleanField(
+        verbose_name='Посты читаются на лету', default=False)
+
+    class Meta:
+        verbose_name = 'Профиль'
+        verbose_name_plural = 'Профили'
+
+    def __str__(self):
+        return f'Профиль {self.user}'
+
+
+class TimelineEntryQuerySet(models.QuerySet):
+    def seek(self, position=None, backwards=False):
+        return seek(self, position, backwards, id_field='post_id')
+
+
+class TimelineEntry(models.Model):
+    """Пост, заранее разложенный в ленту подписчика (push-модель)."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    objects = TimelineEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='timeline_user_date_idx',
+            ),
+            models.Index(
+                fields=('user', 'author'), name='timeline_user_author_idx'),
+        )
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'post'), name='unique_timeline_entry'),
+        )
+
+    def __str__(self):
+        return f'{self.post} в ленте {self.user}'
+
+
+class ImportRecord(models.Model):
+    """Объект, созданный командой import_yatube из внешней записи.
+
+    По этим записям повторный запуск пропускает уже загруженное, а
+    комментарии находят свои посты по id из источника.
+    """
+    POST = 'post'
+    COMMENT = 'comment'
+    KINDS = (
+        (POST, 'Пост'),
+        (COMMENT, 'Комментарий'),
+    )
+
+    kind = models.CharField(
+        verbose_name='Тип', max_length=16, choices=KINDS)
+    source_id = models.CharField(
+        verbose_name='Id в источнике', max_length=64)
+    object_id = models.PositiveIntegerField(verbose_name='Id объекта')
+
+    class Meta:
+        verbose_name = 'Импортированная запись'
+        verbose_name_plural = 'Импортированные записи'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('kind', 'source_id'), name='unique_import_record'),
+        )
+
+    def __str__(self):
+        return f'{self.kind} {self.source_id} → {self.object_id}'
+
+
+class StoredImage(models.Model):
+    """Файл картинки и число постов, которые на него ссылаются."""
+    name = models.CharField(
+        verbose_name='Файл', max_length=255, unique=True)
+    references = models.PositiveIntegerField(
+        verbose_name='Число ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return f'{self.name} ({self.references})'
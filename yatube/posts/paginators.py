@@ -0,0 +1,169 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+def encode_cursor(post, backwards=False):
+    """Упаковывает позицию поста в непрозрачный токен для ?cursor=."""
+    return encode_position((post.pub_date, post.pk), backwards)
+
+
+def encode_position(position, backwards=False):
+    """Токен для позиции (ключ сортировки, pk); ключ — дата или число."""
+    key, pk = position
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    payload = json.dumps([key, pk, int(backwards)]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает ((ключ, pk), backwards) или None для битого токена."""
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        key, pk, backwards = json.loads(payload)
+        # Правильный по формату токен может нести несуществующую дату.
+        if isinstance(key, str):
+            key = parse_datetime(key)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    if isinstance(key, datetime):
+        if timezone.is_naive(key):
+            key = timezone.make_aware(key)
+    elif isinstance(key, (int, float)) and not isinstance(key, bool):
+        key = float(key)
+    else:
+        key = None
+    if key is None or not isinstance(pk, int):
+        return None
+    return (key, pk), bool(backwards)
+
+
+class CursorPage(Page):
+    """Страница, найденная по курсору: без номера и без COUNT(*)."""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Page by cursor>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор ленты, понимающий и ?page=, и ?cursor=.
+
+    Принимает объект с методом seek(position, backwards), например
+    PostQuerySet. Номера страниц работают как раньше, а ссылки
+    «вперёд/назад» строятся по курсору и не зависят от глубины.
+    Позиция по умолчанию — (pub_date, pk); ленты с другой сортировкой
+    переопределяют key_type и position().
+
+    count — число записей или функция, которая его вернёт, например из
+    счётчика или кэша (posts.feed_counts); без него считается COUNT(*).
+    """
+
+    key_type = datetime
+    ELLIPSIS = '…'
+
+    def __init__(self, feed, per_page, count=None, **kwargs):
+        super().__init__(feed.seek(), per_page, **kwargs)
+        self.feed = feed
+        self._count = count
+
+    @cached_property
+    def count(self):
+        if self._count is None:
+            return super().count
+        if callable(self._count):
+            return self._count()
+        return self._count
+
+    def get_elided_page_range(self, number, on_each_side=2, on_ends=1):
+        """Номера страниц вокруг number и по краям, пропуски — ELLIPSIS.
+
+        Ссылок на странице не больше 2 * (on_each_side + on_ends) + 3,
+        сколько бы постов ни было в ленте.
+        """
+        number = self.validate_number(number)
+        if self.num_pages <= (on_each_side + on_ends) * 2:
+            yield from self.page_range
+            return
+        if number > 1 + on_each_side + on_ends + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < self.num_pages - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(
+                self.num_pages - on_ends + 1, self.num_pages + 1)
+        else:
+            yield from range(number + 1, self.num_pages + 1)
+
+    def get_cursor_page(self, token):
+        decoded = decode_cursor(token)
+        if decoded is None:
+            return self.get_page(1)
+        position, backwards = decoded
+        if not isinstance(position[0], self.key_type):
+            return self.get_page(1)
+        posts = list(self.feed.seek(position, backwards)[:self.per_page + 1])
+        has_more = len(posts) > self.per_page
+        posts = posts[:self.per_page]
+        if not backwards:
+            return CursorPage(posts, self, has_more, True)
+        if not posts:
+            return self.get_page(1)
+        posts.reverse()
+        return CursorPage(posts, self, True, has_more)
+
+    def get_first_page(self):
+        """Начало ленты без COUNT(*): только признак продолжения."""
+        objects = list(self.feed.seek()[:self.per_page + 1])
+        return CursorPage(
+            objects[:self.per_page], self, len(objects) > self.per_page,
+            False)
+
+    def position(self, post):
+        return post.pub_date, post.pk
+
+    def next_cursor(self, page):
+        if not page.has_next() or not len(page):
+            return ''
+        return encode_position(self.position(page[len(page) - 1]))
+
+    def previous_cursor(self, page):
+        if not page.has_previous() or not len(page):
+            return ''
+        return encode_position(self.position(page[0]), backwards=True)
+
+
+class CommentPaginator(CursorPaginator):
+    def position(self, comment):
+        return comment.created, comment.pk
+
+
+def paginate(request, feed, paginator_class=CursorPaginator, count=None):
+    """Страница ленты по ?cursor=, а при его отсутствии — по ?page=."""
+    paginator = paginator_class(feed, settings.PAGE_COUNT, count=count)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        return paginator.get_cursor_page(cursor)
+    return paginator.get_page(request.GET.get('page'))
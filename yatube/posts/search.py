@@ -0,0 +1,162 @@
+"""Полнотекстовый поиск по постам через индекс SQLite FTS5.
+
+Таблицы posts_post_fts (текст поста) и posts_comment_fts (по строке на
+комментарий, с post_id) и триггеры, которые держат их в актуальном
+состоянии, создаются миграцией 0012. Совпадения в посте и в его
+комментариях складываются в одну оценку поста при поиске.
+
+SQLite пересоздаёт таблицу на AddField и AlterField и теряет её
+триггеры, поэтому после каждого migrate недостающие триггеры создаются
+заново (ensure_triggers), и миграциям не нужно обходить это сырым SQL.
+"""
+import re
+
+from django.db import connection, connections
+from django.db.models.expressions import RawSQL
+
+from posts.models import Post
+from posts.paginators import CursorPaginator
+
+# Совпадение в тексте поста весит вдвое больше, чем в комментарии.
+COMMENT_WEIGHT = 0.5
+MATCHED_IDS = (
+    'SELECT rowid FROM posts_post_fts WHERE posts_post_fts MATCH %s '
+    'UNION SELECT post_id FROM posts_comment_fts '
+    'WHERE posts_comment_fts MATCH %s AND post_id IS NOT NULL'
+)
+# Найденные посты с оценкой: bm25 тем меньше, чем релевантнее, и
+# каждый совпавший комментарий добавляет к оценке поста.
+FOUND = (
+    'WITH hits (id, score) AS ('
+    'SELECT rowid, bm25(posts_post_fts) FROM posts_post_fts '
+    'WHERE posts_post_fts MATCH %s '
+    f'UNION ALL SELECT post_id, {COMMENT_WEIGHT} * bm25(posts_comment_fts) '
+    'FROM posts_comment_fts '
+    'WHERE posts_comment_fts MATCH %s AND post_id IS NOT NULL), '
+    'found (id, score) AS (SELECT id, SUM(score) FROM hits GROUP BY id) '
+    'SELECT id, score FROM found'
+)
+WORD = re.compile(r'\w+')
+TRIGGERS = (
+    'CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert '
+    'AFTER INSERT ON posts_post BEGIN '
+    'INSERT INTO posts_post_fts (rowid, text) VALUES (new.id, new.text); '
+    'END',
+    'CREATE TRIGGER IF NOT EXISTS posts_post_fts_update '
+    'AFTER UPDATE OF text ON posts_post BEGIN '
+    'UPDATE posts_post_fts SET text = new.text WHERE rowid = new.id; END',
+    'CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete '
+    'AFTER DELETE ON posts_post BEGIN '
+    'DELETE FROM posts_post_fts WHERE rowid = old.id; END',
+    'CREATE TRIGGER IF NOT EXISTS posts_comment_fts_insert '
+    'AFTER INSERT ON posts_comment BEGIN '
+    'INSERT INTO posts_comment_fts (rowid, text, post_id) '
+    'VALUES (new.id, new.text, new.post_id); END',
+    'CREATE TRIGGER IF NOT EXISTS posts_comment_fts_update '
+    'AFTER UPDATE OF text, post_id ON posts_comment BEGIN '
+    'UPDATE posts_comment_fts SET text = new.text, post_id = new.post_id '
+    'WHERE rowid = new.id; END',
+    'CREATE TRIGGER IF NOT EXISTS posts_comment_fts_delete '
+    'AFTER DELETE ON posts_comment BEGIN '
+    'DELETE FROM posts_comment_fts WHERE rowid = old.id; END',
+)
+
+
+def ensure_triggers(using='default'):
+    """Создаёт недостающие триггеры индекса в базе using.
+
+    До миграции 0012 (или после отката ниже неё) таблиц индекса в этом
+    виде нет, и триггеры не создаются.
+    """
+    database = connections[using]
+    if database.vendor != 'sqlite':
+        return
+    tables = database.introspection.table_names()
+    if not {'posts_post_fts', 'posts_comment_fts'} <= set(tables):
+        return
+    with database.cursor() as cursor:
+        for sql in TRIGGERS:
+            cursor.execute(sql)
+
+
+def match_expression(query):
+    """Запрос пользователя в синтаксисе MATCH.
+
+    Каждое слово берётся в кавычки, чтобы операторы FTS5 в запросе не
+    ломали разбор, и ищется как префикс: «пост» найдёт и «постами».
+    Пустая строка означает, что искать нечего.
+    """
+    return ' '.join(f'"{word}"*' for word in WORD.findall(query.lower()))
+
+
+def post_ids(query):
+    """Подзапрос с id найденных постов, например для pk__in."""
+    match = match_expression(query)
+    return RawSQL(MATCHED_IDS, (match, match))
+
+
+class SearchFeed:
+    """Найденные посты, от более релевантных к менее.
+
+    Поддерживает протокол CursorPaginator: позиция — пара (score, id),
+    где score — оценка bm25 (чем меньше, тем релевантнее).
+    """
+
+    def __init__(self, query, position=None, backwards=False):
+        self.query = query
+        self.match = match_expression(query)
+        self.position = position
+        self.backwards = backwards
+
+    def seek(self, position=None, backwards=False):
+        return SearchFeed(self.query, position, backwards)
+
+    def _execute(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def count(self):
+        if not self.match:
+            return 0
+        return self._execute(
+            f'SELECT COUNT(*) FROM ({MATCHED_IDS})', [self.match] * 2,
+        )[0][0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        if not self.match:
+            return []
+        start, stop = key.start or 0, key.stop
+        sql = [FOUND]
+        params = [self.match] * 2
+        direction = '>' if not self.backwards else '<'
+        if self.position is not None:
+            score, pk = self.position
+            sql.append(
+                f'WHERE (score {direction} %s '
+                f'OR (score = %s AND id {direction} %s))'
+            )
+            params += [score, score, pk]
+        order = 'DESC' if self.backwards else 'ASC'
+        sql.append(f'ORDER BY 2 {order}, 1 {order} LIMIT %s OFFSET %s')
+        params += [-1 if stop is None else stop - start, start]
+        rows = self._execute(' '.join(sql), params)
+        posts = Post.objects.feed().in_bulk([pk for pk, _ in rows])
+        found = []
+        for pk, score in rows:
+            if pk in posts:
+                posts[pk].score = score
+                found.append(posts[pk])
+        return found
+
+
+class SearchPaginator(CursorPaginator):
+    key_type = float
+
+    def position(self, post):
+        return post.score, post.pk
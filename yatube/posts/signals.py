@@ -0,0 +1,116 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    post_delete, post_migrate, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from posts import counters, generations, images, search, timeline
+from posts.models import Comment, Follow, Group, Post, Profile
+
+User = get_user_model()
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    if sender.name == 'posts':
+        search.ensure_triggers(using)
+
+
+@receiver(post_save, sender=User)
+def create_profile(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Profile.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous(sender, instance, raw=False, **kwargs):
+    if instance.pk and not instance._state.adding and not raw:
+        instance._previous_group_id, instance._previous_image = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                'group_id', 'image').first() or (None, ''))
+
+
+@receiver(pre_save, sender=Post)
+def describe_image(sender, instance, raw=False, **kwargs):
+    """Размеры и цвет новой картинки записываются вместе с постом, чтобы
+    ленты не открывали файл."""
+    if raw:
+        return
+    if not instance.image:
+        meta = dict.fromkeys(
+            ('image_width', 'image_height', 'image_bytes'), None)
+        meta['image_color'] = ''
+    elif not instance.image._committed:
+        meta = images.describe(instance.image.file)
+    else:
+        return
+    for field, value in meta.items():
+        setattr(instance, field, value)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.post_added(instance)
+        timeline.fan_out(instance)
+    previous_image = getattr(instance, '_previous_image', '')
+    if instance.image.name != previous_image:
+        if instance.image:
+            images.acquire(instance.image.name)
+        if previous_image:
+            images.release(previous_image)
+    generations.post_changed(
+        instance, getattr(instance, '_previous_group_id', None))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.post_added(instance, -1)
+    if instance.image:
+        images.release(instance.image.name)
+    generations.post_changed(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.comment_added(instance)
+        generations.comment_changed(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.comment_added(instance, -1)
+    generations.comment_changed(instance)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        generations.group_changed(instance.pk)
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    generations.group_changed(instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.follow_added(instance)
+        generations.follow_changed(instance)
+        if instance.user_id and instance.author_id:
+            timeline.backfill(instance.user_id, instance.author_id)
+        if instance.author_id:
+            timeline.followers_changed(instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.follow_added(instance, -1)
+    generations.follow_changed(instance)
+    if instance.user_id and instance.author_id:
+        timeline.drop(instance.user_id, instance.author_id)
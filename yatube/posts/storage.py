@@ -0,0 +1,48 @@
+"""Хранилище картинок постов с именами по содержимому.
+
+Файл называется SHA-256 своих байтов и лежит в posts/ab/cd/<хэш>.jpg:
+в одном каталоге не собираются сотни тысяч файлов, а одинаковые
+загрузки превращаются в один файл. Миниатюры sorl строятся по имени
+оригинала, поэтому и они у дубликатов общие.
+
+Сколько постов ссылается на файл, считает StoredImage (posts.images):
+файл удаляется, когда уходит последняя ссылка.
+"""
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+CHUNK_SIZE = 64 * 1024
+HASHED_NAME = re.compile(r'(?:^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+
+def content_name(name, content):
+    """Имя по содержимому в каталоге и с расширением из name."""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in iter(lambda: content.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    content.seek(0)
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    digest = digest.hexdigest()
+    return os.path.join(
+        directory, digest[:2], digest[2:4], f'{digest}{extension}')
+
+
+def is_content_name(name):
+    return bool(HASHED_NAME.search(name))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        name = content_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
@@ -0,0 +1,58 @@
+from django import template
+
+from posts import thumbnails
+
+
+register = template.Library()
+
+UNRESOLVED = object()
+
+
+def srcset(images):
+    return ', '.join(f'{image.url} {image.width}w' for image in images)
+
+
+@register.simple_tag
+def resolve_pictures(page_obj):
+    """Миниатюры всех постов страницы одним обращением к KV-хранилищу;
+    post_picture дальше берёт их у поста."""
+    found = thumbnails.cached_many(page_obj)
+    for post in page_obj:
+        post.resolved_thumbnails = found.get(post.pk)
+    return ''
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(post):
+    """Картинка поста с srcset по пресетам, а пока их строит фон —
+    оригинал."""
+    if not post.image:
+        return {}
+    # Размеры и цвет хранятся в посте: файл ради них не открывается.
+    picture = {
+        'width': post.image_width,
+        'height': post.image_height,
+        'color': post.image_color,
+    }
+    found = getattr(post, 'resolved_thumbnails', UNRESOLVED)
+    if found is UNRESOLVED:
+        found = thumbnails.cached(post)
+        if found is None:
+            thumbnails.enqueue(post)
+    if found is None:
+        picture['src'] = post.image.url
+        return picture
+    main, *others = thumbnails.FORMATS
+    default = found[main][thumbnails.DEFAULT_PRESET]
+    picture.update({
+        'src': default.url,
+        'width': default.width,
+        'height': default.height,
+        'srcset': srcset(found[main].values()),
+        'sources': [
+            (f'image/{format_.lower()}', srcset(found[format_].values()))
+            for format_ in others
+        ],
+        'sizes': thumbnails.SIZES,
+    })
+    return picture
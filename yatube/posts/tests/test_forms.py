@@ -1,10 +1,14 @@
 import shutil
 import tempfile
+from io import BytesIO
+from PIL import Image
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
+from django.core.files.base import ContentFile
 from ..forms import PostForm
 from ..models import Post, Group, Comment
+from ..storage import content_name
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase
 from django.urls import reverse
@@ -67,10 +71,41 @@ class PostCreateFormTests(TestCase):
             Post.objects.filter(
                 text='Тестовый текст 2',
                 group=self.group.id,
-                image='posts/small.gif'
+                image=content_name('posts/small.gif', ContentFile(small_gif))
             ).exists()
         )
 
+    def test_uploaded_photo_is_reencoded_without_metadata(self):
+        photo = BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90° по часовой.
+        exif[0x010F] = 'Камера'
+        Image.new('RGB', (40, 20), 'red').save(
+            photo, 'JPEG', exif=exif.tobytes())
+        self.authorized_client.post(reverse('posts:post_create'), data={
+            'text': 'Фото',
+            'image': SimpleUploadedFile(
+                'photo.jpeg', photo.getvalue(), content_type='image/jpeg'),
+        })
+        post = Post.objects.get(text='Фото')
+        self.assertRegex(post.image.name, r'^posts/\w\w/\w\w/\w{64}\.jpg$')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (20, 40))
+            self.assertFalse(image.getexif())
+            self.assertTrue(image.info.get('progressive'))
+
+    def test_truncated_photo_is_rejected(self):
+        photo = BytesIO()
+        Image.effect_noise((400, 400), 64).convert('RGB').save(
+            photo, 'JPEG')
+        form = PostForm(data={'text': 'Обрезанное фото'}, files={
+            'image': SimpleUploadedFile(
+                'photo.jpeg', photo.getvalue()[:2000],
+                content_type='image/jpeg'),
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+
     def test_edit_post(self):
         self.post = Post.objects.create(
             author=self.author,
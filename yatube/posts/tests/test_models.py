@@ -1,6 +1,19 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
-from ..models import Group, Post, Comment, Follow
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from .. import generations, images
+from ..management.commands.backfill_image_meta import (
+    Command as BackfillImageMeta)
+from ..management.commands.migrate_images import Command as MigrateImages
+from ..models import Group, Post, Comment, Follow, Profile, StoredImage
 
 
 User = get_user_model()
@@ -72,3 +85,351 @@ class FollowModelTest(TestCase):
         follow = FollowModelTest.follow
         expected_text = f'{self.user} подписан на {self.author}'
         self.assertEqual(str(follow), expected_text)
+
+
+class CountersTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.author = User.objects.create_user(username='Author')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+
+    def profile(self, user):
+        return Profile.objects.get(user=user)
+
+    def test_post_counter_follows_creates_and_deletes(self):
+        self.assertEqual(self.profile(self.author).posts_count, 1)
+        self.post.delete()
+        self.assertEqual(self.profile(self.author).posts_count, 0)
+
+    def test_comment_counter_follows_creates_and_deletes(self):
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        comment.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_follow_counters_follow_creates_and_deletes(self):
+        follow = Follow.objects.create(author=self.author, user=self.user)
+        self.assertEqual(self.profile(self.author).followers_count, 1)
+        self.assertEqual(self.profile(self.user).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.profile(self.author).followers_count, 0)
+        self.assertEqual(self.profile(self.user).following_count, 0)
+
+    def test_recount_repairs_drift(self):
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий')
+        Profile.objects.update(posts_count=7)
+        Post.objects.update(comment_count=0)
+        Profile.objects.filter(user=self.user).delete()
+        call_command('recount', chunk_size=1, stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(self.profile(self.author).posts_count, 1)
+        self.assertEqual(self.profile(self.user).posts_count, 0)
+
+    def test_missing_profile_is_created_with_counts(self):
+        Profile.objects.filter(user=self.author).delete()
+        response = self.client.get(f'/profile/{self.author.username}/')
+        self.assertContains(response, 'Всего постов: 1')
+        Profile.objects.filter(user=self.author).delete()
+        Post.objects.create(author=self.author, text='Второй')
+        self.assertEqual(self.profile(self.author).posts_count, 2)
+
+    def test_deleting_user_does_not_recreate_profile(self):
+        Follow.objects.create(author=self.author, user=self.user)
+        author_id = self.author.pk
+        self.author.delete()
+        self.assertFalse(Profile.objects.filter(user_id=author_id).exists())
+
+
+class ImportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug', description='')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('follows.csv', 'user,author\nreader,writer\n'
+                                  'reader,writer\nwriter,writer\n')
+        self.write('posts.ndjson', ''.join(
+            json.dumps(row, ensure_ascii=False) + '\n' for row in (
+                {'id': 'p1', 'author': 'writer', 'group': 'test-slug',
+                 'text': 'Первый', 'pub_date': '2020-01-01T10:00:00'},
+                {'id': 'p2', 'author': 'writer', 'text': 'Второй',
+                 'pub_date': '2020-01-02T10:00:00'},
+                {'id': 'p3', 'author': 'writer', 'group': 'unknown',
+                 'text': 'Без группы'},
+            )))
+        self.write('comments.csv', 'id,post,author,text\n'
+                                   'c1,p1,reader,Привет\nc2,p9,reader,Нет\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, name, content):
+        with open(os.path.join(self.directory, name), 'w') as target:
+            target.write(content)
+
+    def run_import(self):
+        out = StringIO()
+        call_command(
+            'import_yatube',
+            follows=os.path.join(self.directory, 'follows.csv'),
+            posts=os.path.join(self.directory, 'posts.ndjson'),
+            comments=os.path.join(self.directory, 'comments.csv'),
+            batch_size=2,
+            stdout=out,
+        )
+        return out.getvalue()
+
+    def test_import_creates_rows_and_keeps_derived_data(self):
+        report = self.run_import()
+        self.assertIn('Посты: создано 2, пропущено 0, отклонено 1', report)
+        writer = User.objects.get(username='writer')
+        self.assertFalse(writer.has_usable_password())
+        first = Post.objects.get(text='Первый')
+        self.assertEqual(first.pub_date.year, 2020)
+        self.assertEqual(first.group, self.group)
+        self.assertEqual(first.comment_count, 1)
+        self.assertEqual(
+            Profile.objects.get(user=writer).posts_count, 2)
+        self.assertEqual(
+            Profile.objects.get(user=writer).followers_count, 1)
+        self.assertEqual(
+            Profile.objects.get(user=self.reader).following_count, 1)
+        self.assertEqual(self.reader.timeline.count(), 2)
+
+    def test_import_does_not_reuse_deleted_ids(self):
+        deleted = Post.objects.create(author=self.reader, text='Удалённый')
+        deleted_id = deleted.pk
+        deleted.delete()
+        self.run_import()
+        self.assertGreater(
+            Post.objects.order_by('pk').first().pk, deleted_id)
+
+    def test_import_rejects_bad_dates(self):
+        self.write('posts.ndjson', ''.join(
+            json.dumps(row, ensure_ascii=False) + '\n' for row in (
+                {'id': 'p1', 'author': 'writer', 'text': 'Первый',
+                 'pub_date': '2020-13-45T00:00:00'},
+                {'id': 'p2', 'author': 'writer', 'text': 'Второй',
+                 'pub_date': '02.01.2020'},
+                {'id': 'p3', 'author': 'writer', 'text': 'Третий',
+                 'pub_date': '2020-01-03T10:00:00'},
+            )))
+        self.write('comments.csv', 'id,post,author,text,created\n'
+                                   'c1,p3,reader,Привет,2020-02-30T10:00:00\n')
+        report = self.run_import()
+        self.assertIn('Посты: создано 1, пропущено 0, отклонено 2', report)
+        self.assertIn('Комментарии: создано 0, пропущено 0, отклонено 1',
+                      report)
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)), ['Третий'])
+
+    def test_import_is_restartable(self):
+        self.run_import()
+        report = self.run_import()
+        self.assertIn('Посты: создано 0, пропущено 2', report)
+        self.assertIn('Комментарии: создано 0, пропущено 1', report)
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+
+
+class SeedTest(TestCase):
+    def test_seed_builds_skewed_follow_graph(self):
+        call_command(
+            'seed', users=50, groups=3, posts=200, comments=100, follows=5,
+            stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 100)
+        followers = sorted(
+            Profile.objects.values_list('followers_count', flat=True),
+            reverse=True)
+        # Первые пять авторов собирают заметно больше своей доли в 10%.
+        self.assertGreater(sum(followers[:5]), sum(followers) * 0.25)
+
+
+class StoredImageTest(TestCase):
+    GIF = (
+        b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+        b'\x01\x00\x00\x00\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+        b'\x00\x3b'
+    )
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = tempfile.mkdtemp()
+        cls.settings = override_settings(MEDIA_ROOT=cls.media)
+        cls.settings.enable()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        shutil.rmtree(cls.media, ignore_errors=True)
+        super().tearDownClass()
+
+    def upload(self, name='pic.gif'):
+        return Post.objects.create(
+            author=self.user, text='С картинкой',
+            image=SimpleUploadedFile(name, self.GIF))
+
+    def test_identical_uploads_share_one_counted_file(self):
+        first, second = self.upload('a.gif'), self.upload('b.gif')
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertRegex(name, r'^posts/\w\w/\w\w/\w{64}\.gif$')
+        self.assertEqual(StoredImage.objects.get(name=name).references, 2)
+        first.delete()
+        images.collect(name)
+        self.assertTrue(os.path.exists(os.path.join(self.media, name)))
+        second.delete()
+        images.collect(name)
+        self.assertFalse(StoredImage.objects.filter(name=name).exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media, name)))
+
+    def test_collect_keeps_row_when_file_is_not_deleted(self):
+        post = self.upload()
+        name = post.image.name
+        post.delete()
+        storage = Post._meta.get_field('image').storage
+        with mock.patch.object(
+            storage, 'delete', side_effect=OSError('занят')
+        ), self.assertRaises(OSError):
+            images.collect(name)
+        # Строка удаляется в одной транзакции с файлом: раз файл остался,
+        # следующий collect повторит попытку.
+        self.assertTrue(StoredImage.objects.filter(name=name).exists())
+        images.collect(name)
+        self.assertFalse(StoredImage.objects.filter(name=name).exists())
+
+    def test_migrate_images_moves_legacy_files(self):
+        legacy = os.path.join(self.media, 'posts', 'legacy.gif')
+        os.makedirs(os.path.dirname(legacy), exist_ok=True)
+        with open(legacy, 'wb') as file:
+            file.write(self.GIF)
+        posts = [
+            Post.objects.create(
+                author=self.user, text='Старый', image='posts/legacy.gif')
+            for _ in range(2)
+        ]
+        self.assertFalse(StoredImage.objects.exists())
+        out = StringIO()
+        call_command(
+            'migrate_images', '--batch-size=1', '--delete-old', stdout=out)
+        self.assertIn('Перенесено постов: 2', out.getvalue())
+        self.assertFalse(os.path.exists(legacy))
+        names = {Post.objects.get(pk=post.pk).image.name for post in posts}
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(os.path.exists(os.path.join(self.media, name)))
+        self.assertEqual(StoredImage.objects.get(name=name).references, 2)
+        out = StringIO()
+        call_command('migrate_images', stdout=out)
+        self.assertIn('Перенесено постов: 0', out.getvalue())
+
+    def test_import_stores_images_by_content(self):
+        source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source, ignore_errors=True)
+        for name in ('one.gif', 'two.gif'):
+            with open(os.path.join(source, name), 'wb') as file:
+                file.write(self.GIF)
+        posts = os.path.join(source, 'posts.ndjson')
+        with open(posts, 'w') as file:
+            for number, name in enumerate(('one.gif', 'two.gif', 'one.gif')):
+                file.write(json.dumps({
+                    'id': f'i{number}', 'author': 'auth',
+                    'text': 'Импорт', 'image': name}) + '\n')
+        call_command(
+            'import_yatube', posts=posts, media_dir=source,
+            stdout=StringIO())
+        imported = Post.objects.filter(text='Импорт')
+        names = set(imported.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertRegex(name, r'^posts/\w\w/\w\w/\w{64}\.gif$')
+        self.assertEqual(StoredImage.objects.get(name=name).references, 3)
+        self.assertEqual(
+            set(imported.values_list('image_width', 'image_bytes')),
+            {(1, len(self.GIF))})
+
+    def test_migrate_images_keeps_concurrent_edit(self):
+        legacy = os.path.join(self.media, 'posts', 'edited.gif')
+        os.makedirs(os.path.dirname(legacy), exist_ok=True)
+        with open(legacy, 'wb') as file:
+            file.write(self.GIF)
+        post = Post.objects.create(
+            author=self.user, text='Старый', image='posts/edited.gif')
+        command = MigrateImages()
+        command.storage = Post._meta.get_field('image').storage
+        command.moved = {}
+        stale = list(Post.objects.filter(pk=post.pk))
+        # Пока пачка в памяти, автор заменил картинку.
+        Post.objects.filter(pk=post.pk).update(image='posts/new.gif')
+        self.assertEqual(command.switch(stale), 0)
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, 'posts/new.gif')
+        self.assertFalse(StoredImage.objects.exists())
+
+    def test_upload_records_image_meta(self):
+        post = Post.objects.get(pk=self.upload().pk)
+        self.assertEqual((post.image_width, post.image_height), (1, 1))
+        self.assertEqual(post.image_bytes, len(self.GIF))
+        post.image = None
+        post.save()
+        post.refresh_from_db()
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_color, '')
+
+    def test_backfill_image_meta(self):
+        legacy = os.path.join(self.media, 'posts', 'meta.gif')
+        os.makedirs(os.path.dirname(legacy), exist_ok=True)
+        with open(legacy, 'wb') as file:
+            file.write(self.GIF)
+        post = Post.objects.create(
+            author=self.user, text='Старый', image='posts/meta.gif')
+        Post.objects.create(
+            author=self.user, text='Без файла', image='posts/gone.gif')
+        self.assertIsNone(post.image_width)
+        out, err = StringIO(), StringIO()
+        with mock.patch.object(generations, 'bump') as bump:
+            call_command(
+                'backfill_image_meta', '--batch-size=1',
+                stdout=out, stderr=err)
+        # Закэшированные фрагменты с постом перерисуются с размерами.
+        bump.assert_called_once()
+        self.assertIn(generations.post(post.pk), bump.call_args[0])
+        self.assertIn('Обновлено постов: 1, без файла: 1', out.getvalue())
+        self.assertIn('posts/gone.gif', err.getvalue())
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (1, 1))
+        self.assertEqual(post.image_bytes, len(self.GIF))
+
+    def test_backfill_image_meta_keeps_concurrent_edit(self):
+        legacy = os.path.join(self.media, 'posts', 'before.gif')
+        os.makedirs(os.path.dirname(legacy), exist_ok=True)
+        with open(legacy, 'wb') as file:
+            file.write(self.GIF)
+        post = Post.objects.create(
+            author=self.user, text='Старый', image='posts/before.gif')
+        command = BackfillImageMeta()
+        command.storage = Post._meta.get_field('image').storage
+        command.described = {}
+        command.missing = 0
+        stale = list(Post.objects.filter(pk=post.pk))
+        # Пока пачка в памяти, автор заменил картинку.
+        Post.objects.filter(pk=post.pk).update(
+            image='posts/after.gif', image_width=640, image_height=480)
+        with mock.patch.object(generations, 'bump') as bump:
+            self.assertEqual(command.fill(stale), 0)
+        bump.assert_not_called()
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (640, 480))
@@ -0,0 +1,84 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+from ..paginators import encode_cursor, encode_position
+
+User = get_user_model()
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\w+( AS \w+)?$')
+
+
+class QueryPlanTests(TestCase):
+    """Запросы страниц ленты не должны сканировать таблицы целиком
+    и сортировать результат во временном B-дереве."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(15):
+            post = Post.objects.create(
+                author=cls.author,
+                text=f'Тестовый текст {i}',
+                group=cls.group,
+            )
+            Comment.objects.create(
+                post=post, author=cls.reader, text='Комментарий')
+        # Старые посты подписки читаются на лету, а не из TimelineEntry.
+        with override_settings(TIMELINE_BACKFILL_SIZE=5):
+            Follow.objects.create(author=cls.author, user=cls.reader)
+        cls.cursor = encode_cursor(Post.objects.seek()[9])
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_indexed(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        for query in queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            for step in self.explain(query['sql']):
+                with self.subTest(url=url, sql=query['sql'], step=step):
+                    self.assertIsNone(FULL_SCAN.match(step), query['sql'])
+                    self.assertNotIn('TEMP B-TREE', step, query['sql'])
+
+    def test_feed_pages_use_indexes(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'Author'}),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            self.assert_indexed(url)
+            self.assert_indexed(f'{url}?page=2')
+            self.assert_indexed(f'{url}?cursor={self.cursor}')
+
+    def test_post_detail_uses_indexes(self):
+        post = Post.objects.seek().first()
+        self.assert_indexed(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        comment = post.comments.first()
+        cursor = encode_position((comment.created, comment.pk))
+        self.assert_indexed(
+            reverse('posts:post_comments', kwargs={'post_id': post.pk})
+            + f'?cursor={cursor}')
@@ -1,13 +1,31 @@
 from django.contrib.auth import get_user_model
+from io import BytesIO, StringIO
+import base64
+import hashlib
+import json
 import shutil
 import tempfile
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django import forms
-from ..models import Group, Post, Follow
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.models import KVStore
+from unittest import mock
+from .. import export, feed_counts, thumbnails
+from ..models import (
+    Comment, Group, Post, Follow, Profile, TimelineEntry)
+from ..paginators import CursorPaginator, decode_cursor, encode_cursor
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -87,7 +105,7 @@ class PostPagesTests(TestCase):
         self.assertEqual(first_object.author.username, 'Author')
         self.assertEqual(first_object.text, 'Тестовый текст')
         self.assertEqual(first_object.id, 1)
-        self.assertEqual(first_object.image, 'posts/small.gif')
+        self.assertEqual(first_object.image, self.post.image.name)
 
     def check_group(self, first_object):
         self.assertEqual(first_object.group.title, 'Тестовая группа')
@@ -119,6 +137,88 @@ class PostPagesTests(TestCase):
         post.delete()
         self.assertIn(post_text, response.content.decode())
 
+    def test_feed_fragments_follow_content_changes(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'Author'}),
+        )
+        cache.clear()
+        for url in urls:
+            self.guest_client.get(url)
+        Post.objects.filter(pk=self.post.pk).update(text='Тихая правка')
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertNotIn('Тихая правка', response.content.decode())
+        Post.objects.create(
+            author=self.author, text='Свежий пост', group=self.group)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertIn('Свежий пост', response.content.decode())
+
+    def test_unchanged_pages_answer_not_modified(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'Author'}),
+            reverse('posts:post_detail', kwargs={'post_id': 1}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                # Первый ответ может выставить csrf-cookie, она входит в ETag.
+                self.authorized_client.get(url)
+                response = self.authorized_client.get(url)
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_post_detail_etag_follows_comments_and_edits(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': 1})
+        etag = self.authorized_client.get(url)['ETag']
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': 1}),
+            data={'text': 'Комментарий'},
+        )
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.authorized_author_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': 1}),
+            data={'text': 'Исправленный текст'},
+        )
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_thumbnail_falls_back_to_original_until_ready(self):
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': 1}))
+        self.assertContains(response, self.post.image.url)
+
+    def test_thumbnail_worker_renders_every_preset(self):
+        source, images, jobs = None, [], []
+        for _, _, geometry, options in thumbnails.variants():
+            source, image, options = thumbnails.backend.resolve(
+                self.post.image.name, geometry, options)
+            images.append(image)
+            jobs.append((geometry, options))
+        source_size, results = thumbnails._render(
+            self.post.image.path, jobs)
+        self.assertEqual(list(source_size), [2, 1])
+        self.assertEqual(
+            [list(size) for size, _ in results][:3],
+            [[320, 320], [640, 640], [1280, 1280]])
+        future = Future()
+        future.set_result((source_size, results))
+        thumbnails._pending.add(source.name)
+        thumbnails._store(self.post, source, images, future)
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': 1}))
+        self.assertContains(response, f'sizes="{thumbnails.SIZES}"')
+        self.assertContains(response, f'{images[2].url} 1280w')
+        self.assertNotContains(response, self.post.image.url)
+
     def test_group_posts_correct_context(self):
         response = self.guest_client.get(
             reverse('posts:group_list', kwargs={'slug': 'test-slug'}))
@@ -235,6 +335,101 @@ class PaginatorViewsTest(TestCase):
             'posts:profile'), kwargs={'username': 'Alisa'}) + '?page=2')
         self.assertEqual(len(response.context['page_obj']), 3)
 
+    def test_cursor_pages_match_numbered_pages(self):
+        first_page = self.client.get(reverse('posts:index')).context[
+            'page_obj']
+        cursor = first_page.paginator.next_cursor(first_page)
+        response = self.client.get(
+            reverse('posts:index') + f'?cursor={cursor}')
+        second_page = response.context['page_obj']
+        numbered_page = self.client.get(
+            reverse('posts:index') + '?page=2').context['page_obj']
+        self.assertEqual(list(second_page), list(numbered_page))
+        self.assertFalse(second_page.has_next())
+        self.assertTrue(second_page.has_previous())
+
+    def test_previous_cursor_returns_first_page(self):
+        posts = list(Post.objects.seek())
+        cursor = encode_cursor(posts[10], backwards=True)
+        response = self.client.get(
+            reverse('posts:index') + f'?cursor={cursor}')
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj), posts[:10])
+        self.assertFalse(page_obj.has_previous())
+
+    def test_feed_queries_do_not_depend_on_page_size(self):
+        for name, kwargs in (
+            ('posts:index', {}),
+            ('posts:group_list', {'slug': 'test-slug'}),
+            ('posts:profile', {'username': 'Alisa'}),
+        ):
+            with self.subTest(name=name):
+                url = reverse(name, kwargs=kwargs)
+                cache.clear()
+                with CaptureQueriesContext(connection) as full_page:
+                    self.client.get(url)
+                cache.clear()
+                with CaptureQueriesContext(connection) as short_page:
+                    self.client.get(url + '?page=2')
+                self.assertEqual(len(full_page), len(short_page))
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse('posts:index') + '?cursor=xyz')
+        self.assertEqual(response.context['page_obj'].number, 1)
+
+    def test_impossible_and_naive_cursor_dates(self):
+        def token(key):
+            payload = json.dumps([key, 1, 0]).encode()
+            return base64.urlsafe_b64encode(payload).decode()
+        response = self.client.get(
+            reverse('posts:index'), {'cursor': token('2020-13-45T00:00:00')})
+        self.assertEqual(response.context['page_obj'].number, 1)
+        response = self.client.get(
+            reverse('posts:index_updates'),
+            {'cursor': token('2020-13-45T00:00:00')})
+        self.assertEqual(response.status_code, 400)
+        (key, _), _ = decode_cursor(token('2020-01-01T00:00:00'))
+        self.assertTrue(timezone.is_aware(key))
+
+    def test_feed_counts_are_cached_until_feed_changes(self):
+        cache.clear()
+        url = reverse('posts:index')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url + '?page=2')
+        self.assertFalse(
+            [query for query in queries if 'COUNT(' in query['sql']])
+        self.assertEqual(response.context['page_obj'].paginator.count, 13)
+        Post.objects.create(author=self.user, text='Ещё один пост')
+        response = self.client.get(url + '?page=2')
+        self.assertEqual(response.context['page_obj'].paginator.count, 14)
+
+    @override_settings(FEED_COUNT_ASYNC=True)
+    def test_stale_count_is_served_while_refreshing(self):
+        cache.clear()
+        feed_counts.cached('scope', 'old', lambda: 5)
+        compute = mock.Mock(return_value=7)
+        with mock.patch.object(feed_counts, '_get_executor') as executor:
+            self.assertEqual(feed_counts.cached('scope', 'new', compute), 5)
+            self.assertEqual(feed_counts.cached('scope', 'new', compute), 5)
+        compute.assert_not_called()
+        executor.return_value.submit.assert_called_once_with(
+            feed_counts._refresh, 'scope', 'new', compute)
+
+    def test_page_links_are_elided(self):
+        paginator = CursorPaginator(Post.objects.feed(), 10, count=1000)
+        ellipsis = paginator.ELLIPSIS
+        self.assertEqual(
+            list(paginator.get_elided_page_range(50)),
+            [1, ellipsis, 48, 49, 50, 51, 52, ellipsis, 100])
+        self.assertEqual(
+            list(paginator.get_elided_page_range(2)),
+            [1, 2, 3, 4, ellipsis, 100])
+        self.assertEqual(
+            list(CursorPaginator(Post.objects.feed(), 10, count=40)
+                 .get_elided_page_range(3)),
+            [1, 2, 3, 4])
+
 
 class FollowTests(TestCase):
     @classmethod
@@ -305,3 +500,517 @@ class FollowTests(TestCase):
             author=self.author, user=self.follower
         ).exists()
         self.assertFalse(follow)
+
+    def test_new_post_is_pushed_to_follower_timeline(self):
+        Follow.objects.create(author=self.author, user=self.follower)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.follower, post=post).exists())
+
+    def test_unfollow_drops_timeline_entries(self):
+        self.authorized_client.get(
+            reverse('posts:profile_follow', kwargs={'username': 'Author'}))
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.follower).exists())
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': 'Author'}))
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.follower).exists())
+
+    @override_settings(TIMELINE_PULL_THRESHOLD=1)
+    def test_popular_author_posts_are_pulled_on_read(self):
+        Follow.objects.create(author=self.author, user=self.follower)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post, self.post])
+
+    @override_settings(TIMELINE_PULL_THRESHOLD=2)
+    def test_author_dropping_below_threshold_is_backfilled(self):
+        other = User.objects.create_user(username='Other')
+        Follow.objects.create(author=self.author, user=self.follower)
+        Follow.objects.create(author=self.author, user=other)
+        post = Post.objects.create(author=self.author, text='Пока читали')
+        Follow.objects.get(author=self.author, user=other).delete()
+        # Отписка ничего не раскладывает: автор читается на лету.
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post, self.post])
+        call_command('backfill_timeline', released=True, stdout=StringIO())
+        self.assertEqual(
+            set(TimelineEntry.objects.values_list('user', 'post')),
+            {(self.follower.pk, post.pk), (self.follower.pk, self.post.pk)})
+        self.assertFalse(Profile.objects.get(
+            user=self.author).timeline_pulled)
+
+    @override_settings(TIMELINE_BACKFILL_SIZE=2)
+    def test_follow_backfills_only_recent_posts(self):
+        newer = [
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+            for i in range(3)
+        ]
+        self.authorized_client.get(
+            reverse('posts:profile_follow', kwargs={'username': 'Author'}))
+        self.assertEqual(
+            set(TimelineEntry.objects.values_list('post', flat=True)),
+            {newer[2].pk, newer[1].pk})
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            newer[::-1] + [self.post])
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, text=f'Пост про котов номер {i}')
+            for i in range(13)
+        ]
+        cls.other = Post.objects.create(
+            author=cls.author, text='Совсем другая тема')
+        Comment.objects.create(
+            post=cls.other, author=cls.author, text='А тут тоже коты')
+
+    def search(self, query, **params):
+        response = self.client.get(
+            reverse('posts:search'), {'q': query, **params})
+        return response.context['page_obj']
+
+    def test_search_finds_posts_and_comments(self):
+        page = self.search('КОТ')
+        self.assertEqual(page.paginator.count, 14)
+        self.assertEqual(page[0].text, 'Пост про котов номер 0')
+        self.assertEqual(len(self.search('тема')), 1)
+        self.assertEqual(len(self.search('')), 0)
+        self.assertEqual(len(self.search('"*(')), 0)
+
+    def test_migrate_restores_dropped_triggers(self):
+        def triggers():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'trigger'")
+                return {name for name, in cursor.fetchall()}
+
+        expected = {
+            f'posts_{table}_fts_{event}'
+            for table in ('post', 'comment')
+            for event in ('insert', 'update', 'delete')
+        }
+        self.assertLessEqual(expected, triggers())
+        # Так их теряет пересоздание таблицы миграцией в SQLite.
+        with connection.cursor() as cursor:
+            for name in expected:
+                cursor.execute(f'DROP TRIGGER {name}')
+        call_command('migrate', verbosity=0)
+        self.assertLessEqual(expected, triggers())
+        Post.objects.create(author=self.author, text='Новые коты')
+        self.assertEqual(self.search('КОТ').paginator.count, 15)
+
+    def test_search_index_follows_edits(self):
+        post = self.posts[0]
+        post.text = 'Про собак'
+        post.save()
+        self.assertEqual([p.pk for p in self.search('собак')], [post.pk])
+        post.delete()
+        self.assertEqual(len(self.search('собак')), 0)
+
+    def test_search_cursor_pages_match_numbered_pages(self):
+        first = self.search('кот')
+        cursor = first.paginator.next_cursor(first)
+        by_cursor = self.search('кот', cursor=cursor)
+        by_number = self.search('кот', page=2)
+        self.assertEqual(
+            [post.pk for post in by_cursor], [post.pk for post in by_number])
+        self.assertEqual(
+            self.search('кот', cursor=encode_cursor(self.posts[5])).number, 1)
+
+    def test_comments_are_indexed_by_row(self):
+        comment = Comment.objects.create(
+            post=self.posts[1], author=self.author, text='Про хомяков')
+        self.assertEqual([p.pk for p in self.search('хомяк')],
+                         [self.posts[1].pk])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT text, post_id FROM posts_comment_fts '
+                'WHERE rowid = %s', [comment.pk])
+            self.assertEqual(
+                cursor.fetchone(), ('Про хомяков', self.posts[1].pk))
+        comment.delete()
+        self.assertEqual(len(self.search('хомяк')), 0)
+
+    def test_rebuild_restores_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM posts_post_fts')
+            cursor.execute('DELETE FROM posts_comment_fts')
+        self.assertEqual(len(self.search('кот')), 0)
+        call_command('rebuild_search_index', chunk_size=5, stdout=StringIO())
+        self.assertEqual(self.search('кот').paginator.count, 14)
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'тема'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = User.objects.create_user(username='Staff', is_staff=True)
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(7):
+            author = User.objects.create_user(username=f'Author{i}')
+            Post.objects.create(
+                author=author, text=f'Текст {i}', group=cls.group)
+        Post.objects.create(author=cls.staff, text='Без группы')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.staff)
+
+    def export(self, **params):
+        response = self.client.get(reverse('posts:export_posts'), params)
+        self.assertTrue(response.streaming)
+        return [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).splitlines()
+        ]
+
+    def test_export_streams_group_posts_oldest_first(self):
+        rows = self.export(group='test-slug')
+        self.assertEqual(
+            [row['text'] for row in rows],
+            [f'Текст {i}' for i in range(7)],
+        )
+        self.assertEqual(rows[3]['author'], 'Author3')
+        self.assertEqual(rows[3]['group'], 'test-slug')
+
+    def test_export_resumes_after_cursor(self):
+        rows = self.export()
+        resumed = self.export(after=rows[2]['cursor'])
+        self.assertEqual(resumed, rows[3:])
+
+    def test_export_resolves_authors_in_bulk(self):
+        posts = export.select()
+        with CaptureQueriesContext(connection) as queries:
+            list(export.rows(posts, chunk_size=3))
+        # Один запрос постов и по запросу авторов и групп на каждую из
+        # трёх пачек, сколько бы ни было строк.
+        self.assertEqual(len(queries), 1 + 2 * 3)
+
+    def test_export_rejects_bad_parameters(self):
+        url = reverse('posts:export_posts')
+        self.assertEqual(
+            self.client.get(url, {'since': 'вчера'}).status_code, 400)
+        self.assertEqual(
+            self.client.get(url, {'after': 'broken'}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_export_command_writes_ndjson(self):
+        out = StringIO()
+        call_command(
+            'export_posts', author='Staff', stdout=out, stderr=StringIO())
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['text'] for row in rows], ['Без группы'])
+
+
+@override_settings(COMMENTS_PAGE_COUNT=20)
+class CommentPagesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        for i in range(45):
+            commenter = User.objects.create_user(username=f'Reader{i}')
+            Comment.objects.create(
+                post=cls.post, author=commenter, text=f'Комментарий {i}')
+
+    def comments_url(self, **params):
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        return url, params
+
+    def test_post_detail_renders_first_page_only(self):
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 20)
+        self.assertEqual(comments[0].text, 'Комментарий 0')
+        self.assertTrue(comments.has_next())
+        self.assertContains(response, 'Показать ещё комментарии')
+
+    def test_post_detail_queries_do_not_depend_on_comment_count(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Ещё один')
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(url)
+        self.assertEqual(len(before), len(after))
+
+    def test_fragment_endpoint_continues_by_cursor(self):
+        texts = []
+        params = {'format': 'json'}
+        while True:
+            response = self.client.get(*self.comments_url(**params))
+            data = response.json()
+            texts += [comment['text'] for comment in data['comments']]
+            if not data['next']:
+                break
+            params['cursor'] = data['next']
+        self.assertEqual(texts, [f'Комментарий {i}' for i in range(45)])
+        response = self.client.get(*self.comments_url())
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertEqual(len(response.context['comments']), 20)
+
+
+class FeedUpdatesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(title='Группа', slug='updates')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(3):
+            Post.objects.create(
+                author=cls.author, text=f'Старый {i}', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def poll(self, name='posts:index_updates', cursor=None, **kwargs):
+        params = {'cursor': cursor} if cursor else {}
+        response = self.client.get(reverse(name, kwargs=kwargs), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_nothing_new_is_answered_without_database(self):
+        cursor = self.poll()['cursor']
+        self.poll(cursor=cursor)
+        with self.assertNumQueries(0):
+            data = self.poll(cursor=cursor)
+        self.assertEqual(data, {
+            'posts': [], 'cursor': cursor, 'has_more': False})
+
+    def test_new_posts_are_returned_oldest_first(self):
+        cursor = self.poll()['cursor']
+        for i in range(12):
+            Post.objects.create(author=self.author, text=f'Новый {i}')
+        data = self.poll(cursor=cursor)
+        self.assertEqual(
+            [post['text'] for post in data['posts']],
+            [f'Новый {i}' for i in range(10)])
+        self.assertTrue(data['has_more'])
+        data = self.poll(cursor=data['cursor'])
+        self.assertEqual(
+            [post['text'] for post in data['posts']], ['Новый 10', 'Новый 11'])
+        self.assertFalse(data['has_more'])
+
+    def test_group_profile_and_follow_feeds(self):
+        feeds = (
+            ('posts:group_updates', {'slug': 'updates'}),
+            ('posts:profile_updates', {'username': 'Author'}),
+            ('posts:follow_updates', {}),
+        )
+        self.client.force_login(self.reader)
+        cursors = {name: self.poll(name, **kwargs)['cursor']
+                   for name, kwargs in feeds}
+        Post.objects.create(author=self.reader, text='Чужой')
+        post = Post.objects.create(
+            author=self.author, text='Свежий', group=self.group)
+        for name, kwargs in feeds:
+            with self.subTest(name=name):
+                data = self.poll(name, cursors[name], **kwargs)
+                self.assertEqual(
+                    [item['id'] for item in data['posts']], [post.pk])
+
+    def test_bad_requests(self):
+        response = self.client.get(
+            reverse('posts:index_updates'), {'cursor': 'xyz'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('posts:follow_updates'))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(
+            reverse('posts:group_updates', args=('missing',)))
+        self.assertEqual(response.status_code, 404)
+        # Промах не кэшируется: новая группа доступна сразу.
+        Group.objects.create(title='Новая', slug='missing')
+        self.poll('posts:group_updates', slug='missing')
+
+    def test_post_without_author(self):
+        cursor = self.poll()['cursor']
+        orphan = User.objects.create_user(username='Gone')
+        Post.objects.create(author=orphan, text='Сирота')
+        orphan.delete()
+        data = self.poll(cursor=cursor)
+        self.assertEqual(
+            [(post['text'], post['author']) for post in data['posts']],
+            [('Сирота', None)])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def post_with_thumbnails(self, name):
+        image = BytesIO()
+        # Разный цвет — разное содержимое, иначе файлы совпадут.
+        color = tuple(hashlib.md5(name.encode()).digest()[:3])
+        Image.new('RGB', (4, 2), color).save(image, 'JPEG')
+        post = Post.objects.create(
+            author=self.author, text=name, image=SimpleUploadedFile(
+                name, image.getvalue(), content_type='image/jpeg'))
+        source, images, jobs = None, [], []
+        for _, _, geometry, options in thumbnails.variants():
+            source, image, options = thumbnails.backend.resolve(
+                post.image.name, geometry, options)
+            images.append(image)
+            jobs.append((geometry, options))
+        future = Future()
+        future.set_result(thumbnails._render(post.image.path, jobs))
+        thumbnails._pending.add(source.name)
+        thumbnails._store(post, source, images, future)
+        return post, source, images
+
+    def gc(self, *args):
+        out = StringIO()
+        call_command('gc_thumbnails', *args, stdout=out)
+        return out.getvalue()
+
+    def test_orphans_are_removed_and_live_thumbnails_kept(self):
+        live, source, current = self.post_with_thumbnails('live.jpg')
+        stale = ImageFile('cache/stale.jpg', source.storage)
+        stale.write(b'x' * 100)
+        stale.set_size((10, 10))
+        default.kvstore.set(stale, source)
+        deleted, _, orphans = self.post_with_thumbnails('deleted.jpg')
+        deleted.delete()
+        reclaimed = 100 + sum(image.storage.size(image.name)
+                              for image in orphans)
+        output = self.gc()
+        self.assertIn(f'освобождено байт: {reclaimed}', output)
+        self.assertFalse(stale.exists())
+        self.assertFalse(any(image.exists() for image in orphans))
+        self.assertTrue(all(image.exists() for image in current))
+        self.assertIsNotNone(thumbnails.cached(live))
+        self.assertIn('удалено миниатюр: 0', self.gc('--restart'))
+
+    def test_post_saved_during_run_keeps_thumbnails(self):
+        post, _, current = self.post_with_thumbnails('late.jpg')
+        name = post.image.name
+        Post.objects.filter(pk=post.pk).update(image='')
+        select = KVStore.objects.filter
+
+        def filter(*args, **kwargs):
+            # Картинка появляется у поста уже после начала прохода.
+            Post.objects.filter(pk=post.pk).update(image=name)
+            return select(*args, **kwargs)
+
+        with mock.patch.object(KVStore.objects, 'filter', filter):
+            self.assertIn('удалено миниатюр: 0', self.gc('--restart'))
+        self.assertTrue(all(image.exists() for image in current))
+
+    def test_page_thumbnails_are_resolved_in_one_lookup(self):
+        for i in range(3):
+            self.post_with_thumbnails(f'{i}.jpg')
+        Post.objects.create(author=self.author, text='Без картинки')
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:index'))
+        self.assertEqual(len([
+            query for query in queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]), 1)
+        self.assertContains(response, '1280w', count=3)
+
+    def test_feed_does_not_touch_image_files(self):
+        post, _, _ = self.post_with_thumbnails('meta.jpg')
+        self.assertEqual((post.image_width, post.image_height), (4, 2))
+        cache.clear()
+        storage = 'django.core.files.storage.FileSystemStorage'
+        untouched = mock.Mock(side_effect=AssertionError('чтение файла'))
+        with mock.patch(f'{storage}._open', untouched), \
+                mock.patch(f'{storage}.exists', untouched), \
+                mock.patch(f'{storage}.size', untouched):
+            response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'width="640" height="640"')
+        self.assertContains(response, 'background-color: #')
+
+    def test_broken_pool_is_replaced(self):
+        image = BytesIO()
+        Image.new('RGB', (4, 2), (1, 2, 3)).save(image, 'JPEG')
+        post = Post.objects.create(
+            author=self.author, text='pool', image=SimpleUploadedFile(
+                'pool.jpg', image.getvalue(), content_type='image/jpeg'))
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool()
+        fresh = mock.Mock()
+        self.addCleanup(setattr, thumbnails, '_executor', None)
+        with mock.patch.object(thumbnails, '_executor', broken), \
+                mock.patch.object(
+                    thumbnails, 'ProcessPoolExecutor', return_value=fresh):
+            thumbnails._submit(post)
+            self.assertIs(thumbnails._executor, fresh)
+        fresh.submit.assert_called_once()
+        thumbnails._pending.discard(post.image.name)
+        # Если не удаётся и новый пул, запрос всё равно не падает.
+        fresh.submit.side_effect = BrokenProcessPool()
+        with mock.patch.object(thumbnails, '_executor', fresh), \
+                mock.patch.object(
+                    thumbnails, 'ProcessPoolExecutor', return_value=fresh), \
+                self.assertLogs('posts.thumbnails', 'ERROR'):
+            thumbnails._submit(post)
+
+    def test_failed_render_is_not_resubmitted(self):
+        image = BytesIO()
+        Image.new('RGB', (4, 2), (3, 2, 1)).save(image, 'JPEG')
+        post = Post.objects.create(
+            author=self.author, text='broken', image=SimpleUploadedFile(
+                'broken.jpg', image.getvalue(), content_type='image/jpeg'))
+        pool = mock.Mock()
+        pool.submit.side_effect = lambda *args: future
+        future = Future()
+        future.set_exception(OSError('cannot identify image file'))
+        self.addCleanup(cache.clear)
+        with mock.patch.object(thumbnails, '_executor', pool), \
+                self.assertLogs('posts.thumbnails', 'ERROR'):
+            thumbnails._submit(post)
+            thumbnails._submit(post)
+        pool.submit.assert_called_once()
+        self.assertNotIn(post.image.name, thumbnails._pending)
+
+    def test_batches_resume_from_checkpoint(self):
+        for name in ('one.jpg', 'two.jpg'):
+            self.post_with_thumbnails(name)[0].delete()
+        output = self.gc('--batch-size=1', '--max-batches=1')
+        self.assertIn('Проверено оригиналов: 1', output)
+        self.assertIn('продолжим позже', output)
+        output = self.gc('--batch-size=1')
+        self.assertIn('Проверено оригиналов: 1', output)
+        self.assertIn('дошли до конца', output)
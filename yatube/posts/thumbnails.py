@@ -0,0 +1,299 @@
+"""Миниатюры постов, которые строятся в фоне, а не внутри запроса.
+
+Каждая картинка режется во все размеры из PRESETS и во все форматы из
+FORMATS, а шаблон отдаёт их через srcset/sizes: телефон скачивает
+маленькую версию, широкий экран — большую.
+
+Ресайз выполняется в пуле процессов: рабочему процессу передаются путь
+к оригиналу и опции sorl-thumbnail, обратно приходят готовые байты.
+Файлы и записи в KV-хранилище сохраняет родительский процесс, после чего
+сбрасываются поколения фрагментов с этим постом.
+"""
+import hashlib
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import connections, transaction
+from PIL import features
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as thumbnail_defaults
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.models import KVStore
+from sorl.thumbnail.parsers import parse_geometry
+
+from posts import generations
+
+logger = logging.getLogger(__name__)
+
+# Единственное место, где заданы размеры картинок постов.
+PRESETS = {
+    'small': '320x320',
+    'medium': '640x640',
+    'large': '1280x1280',
+}
+# Размер для src, если браузер не понимает srcset.
+DEFAULT_PRESET = 'medium'
+OPTIONS = {
+    'crop': 'center', 'upscale': True, 'quality': 80, 'progressive': True,
+}
+# Первым идёт формат для <img>; WebP — если Pillow собран с libwebp.
+FORMATS = ('JPEG', 'WEBP') if features.check('webp') else ('JPEG',)
+# Ширина колонки с картинкой в карточке поста: col-6 col-md-3.
+SIZES = '(min-width: 768px) 25vw, 50vw'
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+class QueuedThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который умеет только искать готовые миниатюры."""
+
+    def thumbnail_options(self, source, options):
+        # Те же умолчания, что и в ThumbnailBackend.get_thumbnail, иначе
+        # имя файла не совпадёт с тем, что построил бы тег {% thumbnail %}.
+        options = dict(options)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(thumbnail_defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+    def resolve(self, name, geometry_string, options):
+        source = ImageFile(name, default.storage)
+        options = self.thumbnail_options(source, options)
+        thumbnail = ImageFile(
+            self._get_thumbnail_filename(source, geometry_string, options),
+            default.storage,
+        )
+        return source, thumbnail, options
+
+
+backend = QueuedThumbnailBackend()
+
+
+def variants():
+    """(формат, пресет, геометрия, опции sorl) всех миниатюр поста."""
+    for format_ in FORMATS:
+        for preset, geometry in PRESETS.items():
+            yield format_, preset, geometry, dict(OPTIONS, format=format_)
+
+
+class _Source:
+    """Минимум ImageFile, который нужен движку sorl для чтения."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+class _Sink:
+    def write(self, data):
+        self.data = data
+
+
+def expected(name):
+    """Имена файлов всех актуальных миниатюр оригинала name."""
+    return {
+        backend.resolve(name, geometry, options)[1].name
+        for _, _, geometry, options in variants()
+    }
+
+
+def _render(path, jobs):
+    """Выполняется в рабочем процессе: только Pillow, без БД и storage.
+
+    jobs — список (геометрия, опции); оригинал читается один раз.
+    """
+    engine = default.engine
+    with open(path, 'rb') as source_file:
+        data = source_file.read()
+    results = []
+    for geometry_string, options in jobs:
+        image = engine.get_image(_Source(data))
+        options = dict(options, image_info=engine.get_image_info(image))
+        ratio = engine.get_image_ratio(image, options)
+        thumbnail = engine.create(
+            image, parse_geometry(geometry_string, ratio), options)
+        sink = _Sink()
+        engine.write(thumbnail, options, sink)
+        results.append((engine.get_image_size(thumbnail), sink.data))
+    return engine.get_image_size(image), results
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            )
+        return _executor
+
+
+def cached(post):
+    """Готовые миниатюры поста {формат: {пресет: ImageFile}}.
+
+    None, пока построены не все: шаблон тогда показывает оригинал.
+    """
+    found = {}
+    for format_, preset, geometry, options in variants():
+        _, thumbnail, _ = backend.resolve(post.image.name, geometry, options)
+        thumbnail = default.kvstore.get(thumbnail)
+        if thumbnail is None:
+            return None
+        found.setdefault(format_, {})[preset] = thumbnail
+    return found
+
+
+def _get_many_raw(keys):
+    """Сырые значения KV-хранилища: кэш одним get_many, промахи — одним
+    запросом к таблице, как _get_raw у cached_db, только пачкой."""
+    kvstore = default.kvstore
+    if not hasattr(kvstore, 'cache'):
+        return {key: kvstore._get_raw(key) for key in keys}
+    found = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        loaded = dict(
+            KVStore.objects.filter(key__in=missing).values_list(
+                'key', 'value'))
+        fresh = {key: loaded.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(
+            fresh, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+        found.update(fresh)
+    return {
+        key: value for key, value in found.items()
+        if value is not None and value != EMPTY_VALUE
+    }
+
+
+def cached_many(posts):
+    """То же, что cached(), для всех постов страницы одним обращением
+    к KV-хранилищу: {pk поста: миниатюры или None}.
+
+    Посты, у которых построено не всё, ставятся в очередь.
+    """
+    wanted = {}
+    for post in posts:
+        if not post.image:
+            continue
+        for format_, preset, geometry, options in variants():
+            _, thumbnail, _ = backend.resolve(
+                post.image.name, geometry, options)
+            wanted[add_prefix(thumbnail.key)] = post, format_, preset
+    raw = _get_many_raw(list(wanted))
+    found = {}
+    for key, (post, format_, preset) in wanted.items():
+        pictures = found.setdefault(post.pk, {})
+        if pictures is None:
+            continue
+        if key not in raw:
+            found[post.pk] = None
+            enqueue(post)
+            continue
+        pictures.setdefault(format_, {})[preset] = deserialize_image_file(
+            raw[key])
+    return found
+
+
+def enqueue(post):
+    """Ставит построение миниатюры в очередь после фиксации транзакции."""
+    if post.image:
+        transaction.on_commit(partial(_submit, post))
+
+
+def _submit(post):
+    # Вызывается из on_commit, то есть иногда прямо в запросе или шаблоне:
+    # без миниатюры страница покажет оригинал, а ошибка дала бы 500.
+    try:
+        _submit_jobs(post)
+    except Exception:
+        logger.exception(
+            'Не удалось поставить в очередь миниатюру %s', post.image.name)
+
+
+def _failure_key(name):
+    return 'thumbnail-failed:' + hashlib.md5(name.encode()).hexdigest()
+
+
+def _submit_jobs(post):
+    name = post.image.name
+    # Упавшее построение не повторяется на каждом просмотре страницы.
+    if name in _pending or cache.get(_failure_key(name)):
+        return
+    source, thumbnails, jobs = None, [], []
+    for _, _, geometry, options in variants():
+        source, thumbnail, options = backend.resolve(name, geometry, options)
+        if not default.kvstore.get(thumbnail):
+            thumbnails.append(thumbnail)
+            jobs.append((geometry, options))
+    if not jobs:
+        return
+    try:
+        path = default.storage.path(name)
+    except (NotImplementedError, SuspiciousFileOperation):
+        logger.warning('Оригинал %s недоступен на диске', name)
+        return
+    executor = _get_executor()
+    try:
+        future = executor.submit(_render, path, jobs)
+    except BrokenProcessPool:
+        # Рабочий процесс убит (например, OOM на огромной картинке), и
+        # пул больше не принимает задач: создаём новый и пробуем ещё раз.
+        logger.warning('Пул миниатюр сломан, создаётся новый')
+        _reset_executor(executor)
+        future = _get_executor().submit(_render, path, jobs)
+    _pending.add(name)
+    future.add_done_callback(partial(_store, post, source, thumbnails))
+
+
+def _reset_executor(broken):
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False)
+
+
+def _store(post, source, thumbnails, future):
+    try:
+        source_size, results = future.result()
+        source.set_size(source_size)
+        default.kvstore.get_or_set(source)
+        for thumbnail, (size, data) in zip(thumbnails, results):
+            # Storage не перезаписывает файлы, а переименовывает новый;
+            # имя миниатюры должно остаться тем, по которому её ищут.
+            if not thumbnail.exists():
+                thumbnail.write(data)
+            thumbnail.set_size(size)
+            default.kvstore.set(thumbnail, source)
+        generations.post_changed(post)
+    except Exception:
+        logger.exception('Не удалось построить миниатюру %s', source.name)
+        cache.set(
+            _failure_key(source.name), True,
+            settings.THUMBNAIL_FAILURE_TIMEOUT)
+    finally:
+        _pending.discard(source.name)
+        connections.close_all()
@@ -0,0 +1,254 @@
+import heapq
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Q
+
+from posts.models import Follow, Post, Profile, TimelineEntry
+
+
+def _pulled_profiles():
+    # Флаг держит автора в чтении на лету и после того, как подписчиков
+    # стало меньше порога, пока backfill_timeline не заполнит ленты.
+    return Profile.objects.filter(
+        Q(followers_count__gte=settings.TIMELINE_PULL_THRESHOLD)
+        | Q(timeline_pulled=True)
+    )
+
+
+def pulled_author_ids(user):
+    """Авторы из подписок пользователя, чьи посты читаются на лету.
+
+    У популярных авторов слишком много подписчиков, чтобы раскладывать
+    каждый пост по лентам при записи.
+    """
+    return set(
+        _pulled_profiles().filter(
+            user__following__user=user,
+        ).values_list('user_id', flat=True)
+    )
+
+
+def is_pulled(author_id):
+    return _pulled_profiles().filter(user_id=author_id).exists()
+
+
+def _push(entries):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= settings.TIMELINE_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    fan_out_many([post])
+
+
+def fan_out_many(posts):
+    """Раскладывает пачку новых постов: по запросу подписчиков на автора."""
+    posts_by_author = defaultdict(list)
+    for post in posts:
+        if post.author_id is not None:
+            posts_by_author[post.author_id].append(post)
+    for author_id, author_posts in posts_by_author.items():
+        if is_pulled(author_id):
+            continue
+        followers = list(Follow.objects.filter(
+            author_id=author_id, user__isnull=False
+        ).values_list('user_id', flat=True))
+        _push(
+            TimelineEntry(
+                user_id=user_id,
+                post=post,
+                author_id=author_id,
+                pub_date=post.pub_date,
+            )
+            for post in author_posts
+            for user_id in followers
+        )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту пользователя последние посты нового автора."""
+    if is_pulled(author_id):
+        return
+    _backfill(user_id, author_id)
+
+
+def _backfill(user_id, author_id):
+    # Кладутся TIMELINE_BACKFILL_SIZE последних постов, а всё, что
+    # старше timeline_since, TimelineFeed читает на лету: подписка на
+    # автора с длинной историей не копирует её в запросе целиком.
+    posts = Post.objects.filter(author_id=author_id)
+    size = settings.TIMELINE_BACKFILL_SIZE
+    oldest = list(posts.order_by('-pub_date').values_list(
+        'pub_date', flat=True)[size - 1:size])
+    since = oldest[0] if oldest else None
+    if since is not None:
+        posts = posts.filter(pub_date__gte=since)
+    _push(
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for post_id, pub_date in posts.values_list(
+            'pk', 'pub_date').iterator()
+    )
+    Follow.objects.filter(user_id=user_id, author_id=author_id).update(
+        timeline_since=since)
+
+
+def followers_changed(author_id):
+    """У автора появился подписчик.
+
+    Автор, дошедший до TIMELINE_PULL_THRESHOLD, помечается и остаётся в
+    чтении на лету, даже когда подписчиков снова станет меньше: разложить
+    его посты по тысяче лент в запросе отписки нельзя, это делает
+    push_released() из backfill_timeline.
+    """
+    Profile.objects.filter(
+        user_id=author_id,
+        followers_count__gte=settings.TIMELINE_PULL_THRESHOLD,
+        timeline_pulled=False,
+    ).update(timeline_pulled=True)
+
+
+def push_released():
+    """Раскладывает по лентам посты помеченных авторов, у которых
+    подписчиков стало меньше TIMELINE_PULL_THRESHOLD. Возвращает число
+    таких авторов."""
+    released = Profile.objects.filter(
+        timeline_pulled=True,
+        followers_count__lt=settings.TIMELINE_PULL_THRESHOLD,
+    ).values_list('user_id', flat=True)
+    total = 0
+    for author_id in list(released):
+        total += _release(author_id)
+    return total
+
+
+def _release(author_id):
+    follows = Follow.objects.filter(author_id=author_id, user__isnull=False)
+    last_follow = follows.aggregate(last=Max('pk'))['last'] or 0
+    last_post = Post.objects.aggregate(last=Max('pk'))['last'] or 0
+    # Ленты заполняются, пока автор ещё читается на лету, и каждая
+    # подписка — в своей короткой транзакции, а не одной на всех.
+    for user_id in follows.values_list('user_id', flat=True).iterator():
+        with transaction.atomic():
+            _backfill(user_id, author_id)
+    with transaction.atomic():
+        released = Profile.objects.filter(
+            user_id=author_id,
+            timeline_pulled=True,
+            followers_count__lt=settings.TIMELINE_PULL_THRESHOLD,
+        ).update(timeline_pulled=False)
+        if not released:
+            return 0
+        # Подписки и посты, появившиеся за время заполнения, не
+        # раскладывались: автор был помечен.
+        for user_id in follows.filter(pk__gt=last_follow).values_list(
+                'user_id', flat=True):
+            _backfill(user_id, author_id)
+        fan_out_many(Post.objects.filter(
+            author_id=author_id, pk__gt=last_post))
+    return 1
+
+
+def drop(user_id, author_id):
+    """Убирает из ленты пользователя посты автора после отписки."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+class TimelineFeed:
+    """Лента подписок: push-записи из TimelineEntry, слитые через кучу
+    с постами, которые читаются по запросу: популярных авторов и старше
+    начала ленты подписки (Follow.timeline_since).
+
+    Поддерживает протокол CursorPaginator: seek(), count() и срезы.
+    """
+
+    def __init__(self, user, position=None, backwards=False, pulled=None):
+        self.user = user
+        self.position = position
+        self.backwards = backwards
+        self._pulled = pulled
+
+    @property
+    def pulled(self):
+        if self._pulled is None:
+            self._pulled = pulled_author_ids(self.user)
+        return self._pulled
+
+    def seek(self, position=None, backwards=False):
+        return TimelineFeed(self.user, position, backwards, self._pulled)
+
+    def _streams(self):
+        entries = TimelineEntry.objects.filter(user=self.user).exclude(
+            author_id__in=self.pulled)
+        yield entries.seek(self.position, self.backwards).values_list(
+            'pub_date', 'post')
+        for author_id in self.pulled:
+            posts = Post.objects.filter(author_id=author_id)
+            yield posts.seek(self.position, self.backwards).values_list(
+                'pub_date', 'pk')
+
+    def _older_streams(self, last=None):
+        """Посты старше начала ленты подписок, которые могут попасть на
+        страницу, заканчивающуюся ключом last."""
+        follows = Follow.objects.filter(
+            user=self.user, timeline_since__isnull=False,
+        ).exclude(author_id__in=self.pulled)
+        # Все такие посты строго старше timeline_since: подписка не
+        # читается, если граница страницы новее её.
+        if self.backwards and self.position is not None:
+            follows = follows.filter(timeline_since__gt=self.position[0])
+        if not self.backwards and last is not None:
+            follows = follows.filter(timeline_since__gt=last[0])
+        for author_id, since in follows.values_list(
+                'author_id', 'timeline_since'):
+            posts = Post.objects.filter(
+                author_id=author_id, pub_date__lt=since)
+            yield posts.seek(self.position, self.backwards).values_list(
+                'pub_date', 'pk')
+
+    def count(self):
+        older = Post.objects.filter(
+            author__following__user=self.user,
+            pub_date__lt=F('author__following__timeline_since'),
+        ).exclude(author_id__in=self.pulled)
+        return older.seek(self.position, self.backwards).count() + sum(
+            stream.count() for stream in self._streams())
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start, stop = key.start or 0, key.stop
+        streams = [
+            list(stream if stop is None else stream[:stop])
+            for stream in self._streams()
+        ]
+        last = None
+        if stop is not None:
+            head = list(islice(
+                heapq.merge(*streams, reverse=not self.backwards), stop))
+            if stop and len(head) == stop:
+                last = head[-1]
+        streams.extend(
+            stream if stop is None else stream[:stop]
+            for stream in self._older_streams(last)
+        )
+        merged = heapq.merge(*streams, reverse=not self.backwards)
+        keys = [pk for _, pk in islice(merged, start, stop)]
+        posts = Post.objects.feed().in_bulk(keys)
+        return [posts[pk] for pk in keys if pk in posts]
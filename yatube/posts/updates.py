@@ -0,0 +1,62 @@
+"""Новые посты ленты после позиции, которую клиент уже видел.
+
+Для опроса «есть ли что-то новое» база не нужна: в кэше под поколением
+ленты лежит позиция её самого нового поста. Если курсор клиента не
+старше её, ответ собирается из двух-трёх чтений кэша. Поколение
+меняется с каждым изменением ленты, так что позиция в кэше точная.
+"""
+from django.core.cache import cache
+from django.conf import settings
+
+from posts.paginators import encode_position
+
+MISSING = -1
+
+
+def resolve(model, field, value):
+    """pk объекта по slug или username; найденный запоминается в кэше.
+
+    Промах не кэшируется: только что созданная группа или пользователь
+    иначе отвечали бы 404 до истечения ключа.
+    """
+    key = f'pk:{model._meta.label_lower}:{field}:{value}'
+    pk = cache.get(key)
+    if pk is None:
+        pk = model.objects.filter(**{field: value}).values_list(
+            'pk', flat=True).first()
+        if pk is not None:
+            cache.set(key, pk, 60 * 60)
+    return pk
+
+
+def head(feed, scope, generation):
+    """Позиция (pub_date, pk) самого нового поста ленты или None."""
+    key = f'feed-head:{scope}:{generation}'
+    position = cache.get(key, MISSING)
+    if position == MISSING:
+        position = None
+        for post in feed.seek()[:1]:
+            position = post.pub_date, post.pk
+        cache.set(key, position, settings.FEED_CACHE_TIMEOUT)
+    return position
+
+
+def since(feed, scope, generation, position, limit):
+    """Посты новее position от старых к новым, не больше limit.
+
+    Возвращает (посты, курсор, есть ли ещё): следующий запрос с этим
+    курсором продолжит с места, где остановился этот.
+    """
+    newest = head(feed, scope, generation)
+    if position is None:
+        # Первый опрос: клиент только узнаёт, откуда начинать.
+        return [], newest and encode_position(newest) or '', False
+    if newest is None or newest <= position:
+        return [], encode_position(position), False
+    posts = list(feed.seek(position, backwards=True)[:limit + 1])
+    has_more = len(posts) > limit
+    posts = posts[:limit]
+    last = posts[-1] if posts else None
+    cursor = encode_position(
+        (last.pub_date, last.pk) if last else position)
+    return posts, cursor, has_more
@@ -5,13 +5,37 @@ app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('updates/', views.feed_updates, name='index_updates'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
+    path(
+        'group/<slug:slug>/updates/',
+        views.feed_updates,
+        name='group_updates'
+    ),
+    path('search/', views.search, name='search'),
+    path('export/posts.ndjson', views.export_posts, name='export_posts'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path(
+        'profile/<str:username>/updates/',
+        views.feed_updates,
+        name='profile_updates'
+    ),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('posts/<int:post_id>/comment', views.add_comment, name='add_comment'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path('follow/', views.follow_index, name='follow_index'),
+    path(
+        'follow/updates/',
+        views.feed_updates,
+        {'follow': True},
+        name='follow_updates'
+    ),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
@@ -1,16 +1,31 @@
-from django.core.paginator import Paginator
+from datetime import datetime
+
 from django.shortcuts import (render, get_object_or_404, redirect)
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import (
+    Http404, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse,
+    QueryDict, StreamingHttpResponse)
+from django.urls import reverse
+from django.db import transaction
+from django.views.decorators.http import etag
+from posts import (
+    counters, etags, export, feed_counts, generations, thumbnails, updates)
 from posts.models import Post, Group, Follow, User
 from posts.forms import PostForm, CommentForm
+from posts.paginators import CommentPaginator, decode_cursor, paginate
+from posts.search import SearchFeed, SearchPaginator
+from posts.timeline import TimelineFeed
 
 
+@etag(etags.index)
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, settings.PAGE_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = Post.objects.feed()
+    generation = generations.get(generations.INDEX)
+    page_obj = paginate(request, post_list, count=lambda: feed_counts.cached(
+        generations.INDEX, generation, post_list.count))
     template = 'posts/index.html'
     title = 'Последние обновления на сайте'
     text = 'Это главная страница проекта Yatube'
@@ -18,47 +33,62 @@ def index(request):
         'title': title,
         'text': text,
         'page_obj': page_obj,
+        'generation': generation,
+        'cache_timeout': settings.FEED_CACHE_TIMEOUT,
     }
     return render(request, template, context)
 
 
+@etag(etags.group_posts)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    paginator = Paginator(post_list, settings.PAGE_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = group.posts.feed()
+    scope = generations.group(group.pk)
+    generation = generations.get(scope)
+    page_obj = paginate(request, post_list, count=lambda: feed_counts.cached(
+        scope, generation, post_list.count))
     template = 'posts/group_list.html'
     context = {
         'group': group,
         'page_obj': page_obj,
+        'generation': generation,
+        'cache_timeout': settings.FEED_CACHE_TIMEOUT,
     }
     return render(request, template, context)
 
 
+@etag(etags.profile)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('profile'), username=username)
     following = request.user.is_authenticated and Follow.objects.filter(
         user=request.user,
         author=author).exists()
-    post_list = author.posts.all()
-    paginator = Paginator(post_list, settings.PAGE_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if not hasattr(author, 'profile'):
+        author.profile = counters.profile(author.pk)
+    post_list = author.posts.feed()
+    # Число постов автора уже хранит счётчик профиля.
+    page_obj = paginate(request, post_list, count=author.profile.posts_count)
     template = 'posts/profile.html'
     context = {
         'author': author,
         'page_obj': page_obj,
         'following': following,
+        'generation': generations.get(generations.author(author.pk)),
+        'cache_timeout': settings.FEED_CACHE_TIMEOUT,
     }
     return render(request, template, context)
 
 
+@etag(etags.post_detail)
 def post_detail(request, post_id):
     form = CommentForm(request.POST or None)
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post, id=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author__profile', 'group'), id=post_id)
+    comments = CommentPaginator(
+        post.comments.thread(), settings.COMMENTS_PAGE_COUNT
+    ).get_first_page()
     context = {
         'post': post,
         'form': form,
@@ -67,7 +97,117 @@ def post_detail(request, post_id):
     return render(request, template, context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = paginate(request, SearchFeed(query), SearchPaginator)
+    page_query = QueryDict(mutable=True)
+    page_query['q'] = query
+    template = 'posts/search.html'
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': page_query.urlencode() + '&',
+    }
+    return render(request, template, context)
+
+
+@staff_member_required
+def export_posts(request):
+    try:
+        posts = export.select(
+            author=request.GET.get('author'),
+            group=request.GET.get('group'),
+            since=request.GET.get('since'),
+            until=request.GET.get('until'),
+            after=request.GET.get('after'),
+        )
+    except export.ExportError as error:
+        return HttpResponseBadRequest(str(error))
+    return StreamingHttpResponse(
+        export.ndjson(posts),
+        content_type='application/x-ndjson; charset=utf-8',
+    )
+
+
+@etag(etags.post_detail)
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('pk'), id=post_id)
+    paginator = CommentPaginator(
+        post.comments.thread(), settings.COMMENTS_PAGE_COUNT)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        comments = paginator.get_cursor_page(cursor)
+    else:
+        comments = paginator.get_first_page()
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'text': comment.text,
+                    'created': comment.created.isoformat(),
+                    'author': comment.author and comment.author.username,
+                    'author_url': comment.author and reverse(
+                        'posts:profile', args=(comment.author.username,)),
+                }
+                for comment in comments
+            ],
+            'next': paginator.next_cursor(comments),
+        })
+    template = 'posts/includes/comments.html'
+    return render(request, template, {'post': post, 'comments': comments})
+
+
+def feed_updates(request, slug=None, username=None, follow=False):
+    """Посты ленты новее ?cursor=; «ничего нового» отвечается из кэша."""
+    position = None
+    if request.GET.get('cursor'):
+        decoded = decode_cursor(request.GET['cursor'])
+        if decoded is None or not isinstance(decoded[0][0], datetime):
+            return HttpResponseBadRequest('Неверный курсор')
+        position = decoded[0]
+    if follow:
+        # Ради ленты подписок читаем только сессию, без пользователя.
+        user_id = request.session.get(SESSION_KEY)
+        if user_id is None:
+            return HttpResponseForbidden()
+        scope = generations.reader(user_id)
+        feed = TimelineFeed(user_id)
+        generation = generations.get(generations.INDEX, scope)
+    else:
+        posts = Post.objects.feed()
+        if slug is not None:
+            pk = updates.resolve(Group, 'slug', slug)
+            scope, posts = generations.group(pk), posts.filter(group_id=pk)
+        elif username is not None:
+            pk = updates.resolve(User, 'username', username)
+            scope, posts = generations.author(pk), posts.filter(author_id=pk)
+        else:
+            pk, scope = 0, generations.INDEX
+        if pk is None:
+            raise Http404
+        feed, generation = posts, generations.get(scope)
+    posts, cursor, has_more = updates.since(
+        feed, scope, generation, position, settings.PAGE_COUNT)
+    return JsonResponse({
+        'posts': [
+            {
+                'id': post.pk,
+                'text': post.text,
+                'pub_date': post.pub_date.isoformat(),
+                'author': post.author and post.author.username,
+                'group': post.group and post.group.slug,
+                'url': reverse('posts:post_detail', args=(post.pk,)),
+            }
+            for post in posts
+        ],
+        'cursor': cursor,
+        'has_more': has_more,
+    })
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if not form.is_valid():
@@ -77,10 +217,12 @@ def post_create(request):
     post = form.save()
     post.author = request.user
     post.save()
+    thumbnails.enqueue(post)
     return redirect('posts:profile', post.author)
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     is_edit = True
     post = get_object_or_404(Post, id=post_id)
@@ -92,7 +234,8 @@ def post_edit(request, post_id):
         instance=post
     )
     if form.is_valid():
-        form.save()
+        post = form.save()
+        thumbnails.enqueue(post)
         return redirect('posts:post_detail', post_id=post_id)
     context = {
         'post': post,
@@ -103,6 +246,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
@@ -117,10 +261,11 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, settings.PAGE_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    feed = TimelineFeed(request.user)
+    generation = generations.get(
+        generations.INDEX, generations.reader(request.user.pk))
+    page_obj = paginate(request, feed, count=lambda: feed_counts.cached(
+        generations.reader(request.user.pk), generation, feed.count))
     template = 'posts/follow.html'
     title = 'Новости'
     text = 'Последние обновления'
@@ -128,11 +273,14 @@ def follow_index(request):
         'title': title,
         'text': text,
         'page_obj': page_obj,
+        'generation': generation,
+        'cache_timeout': settings.FEED_CACHE_TIMEOUT,
     }
     return render(request, template, context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     follower = request.user
     following = get_object_or_404(User, username=username)
@@ -146,6 +294,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     follower = request.user
     following = get_object_or_404(User, username=username)
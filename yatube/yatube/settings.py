@@ -54,7 +54,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.sqlstats.SQLStatsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.replicas.ReplicaMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -92,8 +94,34 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # Локальная реплика: копия основной базы, которую обновляет
+    # команда sync_replica. В тестах это то же соединение, что default.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
 }
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+# Базы, с которых читают GET-запросы; пусто — всё читается из default.
+# Чтобы попробовать реплику, выполните sync_replica и добавьте 'replica'.
+REPLICA_DATABASES = []
+# Сколько секунд после записи пользователь читает основную базу.
+REPLICA_STICKY_SECONDS = 10
+
+# Применяются к каждому соединению (core.sqlite), busy_timeout — первым,
+# чтобы смена режима журнала тоже ждала занятую базу.
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение — размер в КиБ, а не в страницах.
+    'cache_size': -64 * 1024,
+}
+# Режим BEGIN для transaction.atomic(): DEFERRED, IMMEDIATE или EXCLUSIVE.
+SQLITE_TRANSACTION_MODE = 'IMMEDIATE'
 
 
 # Password validation
@@ -142,11 +170,54 @@ LOGIN_REDIRECT_URL = 'posts:index'
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 PAGE_COUNT = 10
+# Комментарии на странице поста и в каждой догружаемой порции.
+COMMENTS_PAGE_COUNT = 20
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Файлы MEDIA_URL отдаёт core.views.serve_media. None — через FileResponse
+# (sendfile WSGI-сервера), 'x-accel-redirect' — через nginx, где
+# MEDIA_ACCEL_REDIRECT_PREFIX — internal location с alias на MEDIA_ROOT,
+# 'x-sendfile' — через Apache mod_xsendfile или lighttpd.
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+# Имена по содержимому: оригиналы постов (posts.storage) и миниатюры sorl,
+# чьё имя — хэш имени оригинала и параметров.
+MEDIA_IMMUTABLE_PATTERNS = [
+    r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$',
+    r'^cache/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}\.\w+$',
+]
+MEDIA_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+MEDIA_MAX_AGE = 60 * 60
+# Один кэш на все процессы: фрагменты и поколения общие для воркеров.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'COMPRESS_MIN_LENGTH': 4096,
+        },
     }
 }
+# Авторы с таким числом подписчиков не раскладываются по лентам при записи,
+# их посты подмешиваются в ленту подписок при чтении. Обратно в ленты
+# автора возвращает backfill_timeline --released, запускаемая по cron.
+TIMELINE_PULL_THRESHOLD = 1000
+TIMELINE_BATCH_SIZE = 500
+# Сколько последних постов автора кладётся в ленту при подписке; более
+# старые лента подписок читает на лету.
+TIMELINE_BACKFILL_SIZE = 100
+# Фрагменты лент сбрасываются сменой поколения, а не по таймауту.
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+# Устаревшее число постов ленты отдаётся сразу, а пересчитывается в фоне.
+FEED_COUNT_ASYNC = True
+# Процессы, которые строят миниатюры постов в фоне.
+THUMBNAIL_WORKERS = 2
+# Сколько секунд не строить заново миниатюры оригинала, на котором
+# построение упало (битый или пропавший файл).
+THUMBNAIL_FAILURE_TIMEOUT = 60 * 60
+# Доля запросов, для которых меряется SQL (заголовок Server-Timing и
+# страница /stats/sql/), и как часто процесс сбрасывает итоги в кэш.
+SQL_STATS_SAMPLE_RATE = 1.0 if DEBUG else 0.05
+SQL_STATS_FLUSH_INTERVAL = 10
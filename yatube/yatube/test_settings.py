@@ -0,0 +1,11 @@
+"""Настройки для тестов: pytest (pytest.ini) и manage.py test."""
+from yatube.settings import *  # noqa: F401,F403
+
+# Тестам нужен чистый кэш на каждый запуск, а файл переживает процесс.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+# Фоновый поток не видит данных незакрытой транзакции теста.
+FEED_COUNT_ASYNC = False